@@ -1,6 +1,36 @@
-import pandas as pd
+import argparse
+import csv
 from collections import defaultdict
 import re
+import sys
+
+from conflicts import conflicts
+from external_sort import sort_records
+from inputs import open_input
+from profiling import profiler
+from text_index import write_index, write_shards
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--index", action='store_true', help="Also write the byte offsets of each entry in "
+                                                          "Vallex4UMR.txt to Vallex4UMR.txt.idx (see text_index.py).")
+parser.add_argument("--shard_dir", help="Also split Vallex4UMR.txt by lemma initial into this directory, with a "
+                                        "manifest and an index per shard.")
+parser.add_argument("--sort_buffer", type=int, help="Number of entries sorted in memory when writing the output; "
+                                                   "beyond that, sorted runs are merged from temporary files.")
+parser.add_argument("--conflicts", help="Path of a JSON report of the frames conflicting with existing entries "
+                                         "(a text version is written next to it, with .txt extension).")
+parser.add_argument("--profile", help="Path of a JSON report with time, memory and counts of each stage.")
+parser.add_argument("--cprofile", action='store_true', help="With --profile, also run cProfile: the hottest functions "
+                                                            "are added to the report, and all stats saved as .prof.")
+parser.add_argument("--no_trace_memory", action='store_true', help="With --profile, do not trace memory allocations "
+                                                                   "(tracemalloc slows the build down); only peak RSS "
+                                                                   "is recorded.")
+
+
+base_id = re.compile(r"^(.*?)-(\d+)$")
+new_id = re.compile(r"^(.*?)-NEW-(\d+)$")
+
 
 def custom_sort_key(pr_id):
     """
@@ -11,13 +41,13 @@ def custom_sort_key(pr_id):
     """
 
     # Case 1: plain base like habeo-25
-    m_base = re.match(r"^(.*?)-(\d+)$", pr_id)
+    m_base = base_id.match(pr_id)
     if m_base:
         lemma, num = m_base.groups()
         return lemma, int(num), 0  # 0 = base
 
     # Case 2: NEW variant of base like habeo-NEW-25
-    m_new = re.match(r"^(.*?)-NEW-(\d+)$", pr_id)
+    m_new = new_id.match(pr_id)
     if m_new:
         lemma, num = m_new.groups()
         return lemma, int(num), 1  # 1 = NEW, comes after base
@@ -26,8 +56,24 @@ def custom_sort_key(pr_id):
     return pr_id, float("inf"), 2  # keep them later, natural order
 
 
-def format_info(dataframe, predicate, frame_dict, output):
-    exs_csv = dataframe.loc[df["frame"].isin(frame_dict[predicate]['frames']), "example"].tolist()
+def read_sum_frames(frames_file):
+    """Read the reviewed frames from the sum/habeo frames file."""
+    with open_input(frames_file, encoding="utf-8") as frames:
+        return [row for row in csv.DictReader(frames) if row['status'] == 'reviewed']
+
+
+def index_examples(frames):
+    """Map each frame to the (row number, example) pairs where it occurs, so that examples are not searched for."""
+    examples_index = defaultdict(list)
+    for row_number, row in enumerate(frames):
+        examples_index[row['frame']].append((row_number, row['example']))
+    return examples_index
+
+
+def format_info(examples_index, predicate, frame_dict, output):
+    # Examples from the frames file, in the order of its rows
+    rows = sorted({pair for frame in frame_dict[predicate]['frames'] for pair in examples_index.get(frame, [])})
+    exs_csv = [example for _, example in rows]
     exs_vallex = output[predicate].get("examples", [])
     exs = list(dict.fromkeys(exs_vallex + exs_csv))
     pos_value = output[predicate].get("POS")  # try to fetch stored POS
@@ -77,8 +123,6 @@ def format_info(dataframe, predicate, frame_dict, output):
     return formatted_info
 
 
-predicate_info = defaultdict(lambda: {"roles": set(), "frames": []})
-
 abstract_predicates = {
     'exist-91': 'ACT [ARG1]',
     'have-mod-91': 'ACT [ARG1], PAT [ARG2]',
@@ -94,43 +138,71 @@ abstract_predicates = {
     'have-example-91': 'ACT [ARG1], PAT [ARG2]'
     }
 
-if __name__ == "__main__":
-
-    # Step 1: Read Vallex file and extract existing information
-    existing_entries = {}
 
+def iter_vallex4umr(filename):
+    """
+    Read the Vallex4UMR file produced by converter.py one entry at a time.
+    Yields (UMR id, information) pairs, in the order of the file, each as soon as its block has been read.
+    """
     current_pred = None  # lemma
-    current_id = None  # actual predicate id, will be dictionary key
+    current_id = None  # actual predicate id
+    current_info = None
 
-    with open("Vallex4UMR.txt", "r", encoding="utf-8") as vallex:
+    with open(filename, "r", encoding="utf-8") as vallex:
         for line in vallex:
             line = line.strip()
             if line.startswith("* "):
                 current_pred = line[2:]  # store lemma for printing
             elif line.startswith(": id:"):
+                if current_id is not None:
+                    yield current_id, current_info
                 current_id = line[len(": id:"):].strip()
-                if current_id not in existing_entries:
-                    existing_entries[current_id] = {"lemma": current_pred}
+                current_info = {"lemma": current_pred}
             elif line.startswith("+"):
-                existing_entries[current_id]['roles'] = line[2:].strip()
+                current_info['roles'] = line[2:].strip()
             elif line.startswith("-synset_id:"):
-                existing_entries[current_id]['synset_id'] = line[len("-synset_id:"):].strip()
+                current_info['synset_id'] = line[len("-synset_id:"):].strip()
             elif line.startswith("-synset_definition:"):
-                existing_entries[current_id]['synset_definition'] = line[len("-synset_definition:"):].strip()
+                current_info['synset_definition'] = line[len("-synset_definition:"):].strip()
             elif line.startswith("-lemma_URI:"):
-                existing_entries[current_id]['lemma_URI'] = line[len("-lemma_URI:"):].strip()
+                current_info['lemma_URI'] = line[len("-lemma_URI:"):].strip()
             elif line.startswith("-POS:"):
                 pos_val = line[len("-POS:"):].strip()
-                existing_entries[current_id]['POS'] = pos_val
+                current_info['POS'] = pos_val
+            elif line.startswith("-gramm_info:"):
+                current_info['gramm_info'] = line[len("-gramm_info:"):].strip()
             elif line.startswith("-Vallex1_id:"):
                 frames = line[len("-Vallex1_id:"):].strip().split("; ")
-                existing_entries[current_id]['frames'] = frames
+                current_info['frames'] = frames
             elif line.startswith("-example:"):
                 examples = line[len("-example:"):].strip().split("; ")
-                existing_entries[current_id]['examples'] = examples
+                current_info['examples'] = examples
             elif line.startswith("-LDT_ids:"):
                 ldt_ids = line[len("-LDT_ids:"):].strip().split("; ")
-                existing_entries[current_id]['LDT_ids'] = ldt_ids
+                current_info['LDT_ids'] = ldt_ids
+
+    if current_id is not None:
+        yield current_id, current_info
+
+
+def read_vallex4umr(filename):
+    """Read the Vallex4UMR file produced by converter.py and extract the existing information."""
+    existing_entries = {}
+    for current_id, info in iter_vallex4umr(filename):
+        if current_id in existing_entries:  # repeated id: its lines update the first entry
+            del info["lemma"]
+            existing_entries[current_id].update(info)
+        else:
+            existing_entries[current_id] = info
+    return existing_entries
+
+
+def add_sum_frames(existing_entries, frames_file):
+    """
+    Merge the reviewed frames for sum and habeo into the existing entries.
+    Returns the updated entries, the roles and frames collected for each predicate, and the examples of each frame.
+    """
+    predicate_info = defaultdict(lambda: {"roles": set(), "frames": []})
 
     for pred_id, info in existing_entries.items():
         if "roles" in info and info["roles"]:
@@ -138,12 +210,9 @@ if __name__ == "__main__":
         if "frames" in info and info["frames"]:
             predicate_info[pred_id]['frames'].extend(info["frames"])
 
-    # Step 2: Read CSV files with sum and habeo frames
-    df = pd.read_csv('sum_habeo_frames.csv', header=0)
-    df = df[df['status'] == 'reviewed'].drop(columns=['status', 'notes', 'conversion rules', 'frequency'])
+    frames_rows = read_sum_frames(frames_file)
 
-    # Step 3: Process frames
-    for _, row in df.iterrows():
+    for row in frames_rows:
         predicate_id = row["UMR concept"]
 
         # --- Extract roles from functors and UMR roles ---
@@ -191,6 +260,7 @@ if __name__ == "__main__":
 
             else:
                 # Conflict: create a new entry
+                conflicts.record('sum_frames_roles', predicate_id, roles_string, existing_roles, row['frame'])
                 conflict_id = f"{predicate_id}-conflict"
                 syn_def = str(row.get("meaning") or "").strip()
                 existing_entries[conflict_id] = {
@@ -208,9 +278,57 @@ if __name__ == "__main__":
                 predicate_info[conflict_id]['roles'].add(roles_string)
                 predicate_info[conflict_id]['frames'].append(row['frame'])
 
-    # Sort before printing everything at the end.
-    with open("Vallex4UMR.txt", "w", encoding="utf-8") as output_file:
-        for predicate_id in sorted(existing_entries.keys(), key=custom_sort_key):
-            entry_text = format_info(df, predicate_id, predicate_info, existing_entries)
+    return existing_entries, predicate_info, index_examples(frames_rows)
+
+
+def write_vallex4umr(existing_entries, predicate_info, examples_index, filename, max_in_memory=None, tmp_dir=None):
+    """
+    Sort the entries and print everything out.
+    The sort key of each entry is computed once, and the formatted entries are sorted in memory or,
+    beyond max_in_memory entries, on disk (see external_sort.py).
+    """
+    formatted = ((custom_sort_key(predicate_id),
+                  format_info(examples_index, predicate_id, predicate_info, existing_entries))
+                 for predicate_id in existing_entries)
+    with open(filename, "w", encoding="utf-8") as output_file:
+        for _, entry_text in sort_records(formatted, max_in_memory, tmp_dir):
             output_file.write(entry_text)
 
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    if args.profile:
+        profiler.start(trace_memory=not args.no_trace_memory, cprofile=args.cprofile)
+        custom_sort_key = profiler.wrap('custom_sort_key', custom_sort_key)
+        format_info = profiler.wrap('format_info', format_info)
+
+    # Step 1: Read Vallex file and extract existing information
+    with profiler.stage('parse') as stage:
+        existing_entries = read_vallex4umr("Vallex4UMR.txt")
+        stage['entries'] = len(existing_entries)
+
+    # Step 2: Read CSV files with sum and habeo frames, and process them
+    with profiler.stage('merge') as stage:
+        existing_entries, predicate_info, examples_index = add_sum_frames(existing_entries, 'sum_habeo_frames.csv')
+        stage['entries'] = len(existing_entries)
+
+    # Sort before printing everything at the end.
+    with profiler.stage('format_and_write') as stage:
+        write_vallex4umr(existing_entries, predicate_info, examples_index, "Vallex4UMR.txt", args.sort_buffer)
+        stage['entries'] = len(existing_entries)
+
+    if conflicts:
+        print(conflicts.format_summary(), file=sys.stderr)
+    if args.conflicts:
+        conflicts.write(args.conflicts)
+
+    if args.index or args.shard_dir:
+        with profiler.stage('index_output'):
+            if args.index:
+                write_index("Vallex4UMR.txt")
+            if args.shard_dir:
+                write_shards("Vallex4UMR.txt", args.shard_dir)
+
+    if args.profile:
+        profiler.write(args.profile)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Benchmark of the Vallex4UMR build on synthetic inputs of configurable size.
+
+The WordNet, mapping, Vallex2 and frames_Sallust-style annotation files are generated from the files committed in
+this repository (mapping, annotation files, sum/habeo frames), so that the benchmark runs offline. The proportions
+of -NEW, merged (a-01/a-02), -91 and malformed UMR ids are those of the committed annotation files, unless given.
+converter.py and append_sum_frames.py are then run with --profile, and the time of each stage and of the full
+build is appended to a JSON Lines file, together with the current commit, to be compared across commits.
+
+    python3 benchmark.py --rows 10000 100000 1000000
+    python3 benchmark.py --show
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+
+from converter import is_well_formed
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, nargs='+', default=[10000], help="Numbers of annotation rows to benchmark.")
+parser.add_argument("--workdir", default='benchmark_data', help="Directory where synthetic inputs are generated.")
+parser.add_argument("--results", default='benchmark_results.jsonl', help="File the results are appended to.")
+parser.add_argument("--mapping_scale", type=int, default=1,
+                    help="Number of copies (with renamed lemmas) of the committed mapping in the synthetic one.")
+parser.add_argument("--wordnet_extra", type=int, default=50000,
+                    help="Number of WordNet synsets not referenced by the mapping nor by the annotation files.")
+parser.add_argument("--new", type=float, help="Share of -NEW UMR ids among annotation rows.")
+parser.add_argument("--merged", type=float, help="Share of merged UMR ids (e.g. polliceor-01/polliceor-02).")
+parser.add_argument("--abstract", type=float, help="Share of UMR abstract predicates (-91).")
+parser.add_argument("--malformed", type=float, help="Share of malformed UMR ids.")
+parser.add_argument("--seed", type=int, default=1, help="Seed of the random generator.")
+parser.add_argument("--repeat", type=int, default=1, help="Number of runs for each size.")
+parser.add_argument("--regenerate", action='store_true', help="Generate the inputs again even if they exist.")
+parser.add_argument("--converter_args", default='', help="Additional arguments for converter.py, e.g. '--jobs 4'.")
+parser.add_argument("--show", action='store_true', help="Only print the results recorded so far.")
+
+input_names = ['frames_Sallust_1-10.csv', 'frames_Sallust_11-20.csv', 'frames_Sallust_21-30.csv',
+               'frames_Sallust_31-40.csv', 'frames_Sallust_41-51.csv', 'frames_Sallust_52-61.csv']
+
+
+def lemma_suffix(copy):
+    """Letters-only suffix for the n-th copy of a lemma (UMR ids only allow letters and one digit)."""
+    suffix = ''
+    while copy:
+        copy, letter = divmod(copy - 1, 26)
+        suffix = chr(ord('a') + letter) + suffix
+    return suffix
+
+
+def read_seeds():
+    """Read the committed annotation files and mapping, grouping annotation rows by kind of UMR id."""
+    seeds = {'fieldnames': None, 'kinds': defaultdict(list)}
+    for file_path in sorted(glob.glob(os.path.join(REPO, 'files_26.8.24', 'frames_Sallust_*.csv'))):
+        with open(file_path, mode='r') as infile:
+            reader = csv.DictReader(infile)
+            if seeds['fieldnames'] is None:
+                seeds['fieldnames'] = reader.fieldnames
+            for row in reader:
+                if 'Par.' in row['id']:
+                    continue
+                seeds['kinds'][umr_kind(row['UMR'])].append(row)
+    with open(os.path.join(REPO, 'latvallex2_umr_mapping.tsv'), mode='r') as mapping:
+        seeds['mapping'] = list(csv.DictReader(mapping, delimiter='\t'))
+    return seeds
+
+
+def umr_kind(umr_entry):
+    if umr_entry.endswith('-91'):
+        return 'abstract'
+    if not is_well_formed(umr_entry):
+        return 'malformed'
+    if '/' in umr_entry:
+        return 'merged'
+    return 'new' if 'NEW' in umr_entry else 'standard'
+
+
+def proportions(seeds, args):
+    """Shares of each kind of UMR id: from the arguments if given, otherwise from the committed files."""
+    counts = Counter({kind: len(rows) for kind, rows in seeds['kinds'].items()})
+    total = sum(counts.values())
+    shares = {kind: getattr(args, kind) if getattr(args, kind) is not None else counts[kind] / total
+              for kind in ('new', 'merged', 'abstract', 'malformed')}
+    shares['standard'] = max(0.0, 1 - sum(shares.values()))
+    return shares
+
+
+def generate_mapping(seeds, scale):
+    rows = []
+    for copy in range(scale):
+        suffix = lemma_suffix(copy)
+        for row in seeds['mapping']:
+            base, _, sense = row['UMR_id'].partition('-')
+            rows.append({'lemma': row['lemma'] + suffix, 'uri': row['uri'] + (f'-{copy}' if copy else ''),
+                         'id_synset': row['id_synset'], 'UMR_id': f"{base}{suffix}-{sense}"})
+    return rows
+
+
+def generate_inputs(directory, n_rows, seeds, args):
+    """Write the synthetic WordNet, mapping, Vallex2 and annotation files (and sum/habeo frames) to directory."""
+    rng = random.Random(args.seed)
+    shares = proportions(seeds, args)
+    well_formed = seeds['kinds']['standard'] + seeds['kinds']['new'] + seeds['kinds']['merged']
+    texts = [row['example'] for row in well_formed if row['example']]
+    functors = [row['roles'].replace(' ', '') for row in well_formed if row['roles']]
+    os.makedirs(os.path.join(directory, 'files_26.8.24'), exist_ok=True)
+    shutil.copy(os.path.join(REPO, 'sum_habeo_frames.csv'), directory)
+
+    mapping = generate_mapping(seeds, args.mapping_scale)
+    with open(os.path.join(directory, 'mapping.tsv'), 'w', newline='') as output:
+        writer = csv.DictWriter(output, fieldnames=['lemma', 'uri', 'id_synset', 'UMR_id'], delimiter='\t')
+        writer.writeheader()
+        writer.writerows(mapping)
+
+    with open(os.path.join(directory, 'vallex.tsv'), 'w', newline='') as output:
+        writer = csv.writer(output, delimiter='\t')
+        writer.writerow(['uri', 'id_synset', 'arguments_set'])
+        for key in dict.fromkeys((row['uri'], row['id_synset']) for row in mapping):
+            writer.writerow([*key, rng.choice(functors)])
+
+    senses = defaultdict(list)  # lemma -> mapping rows, to build merged ids
+    for row in mapping:
+        senses[row['UMR_id'].split('-')[0]].append(row)
+    polysemous = [rows for rows in senses.values() if len(rows) > 1]
+
+    synsets = {syn_id for row in mapping for syn_id in row['id_synset'].split('/')}
+    kinds, weights = zip(*shares.items())
+    chunk = -(-n_rows // len(input_names))
+    written = 0
+    for number, name in enumerate(input_names):
+        with open(os.path.join(directory, 'files_26.8.24', name), 'w', newline='') as output:
+            writer = csv.DictWriter(output, fieldnames=seeds['fieldnames'], extrasaction='ignore')
+            writer.writeheader()
+            for i in range(min(chunk, n_rows - written)):
+                if i % 45 == 0:  # about one paragraph every 45 rows, as in the committed files
+                    writer.writerow({'id': f'Par. {number * 1000 + i // 45 + 1}'})
+                kind = rng.choices(kinds, weights)[0]
+                row = dict(rng.choice(seeds['kinds'][kind] or well_formed))
+                row['id'] = f'Syn-{number}-{i}'
+                if kind in ('standard', 'new'):
+                    target = rng.choice(mapping)
+                    base = target['UMR_id'].split('-')[0]
+                    row.update(lemma=target['lemma'], synset_id=target['id_synset'],
+                               UMR=target['UMR_id'] if kind == 'standard' else f"{base}-NEW-{rng.randint(1, 30):02d}")
+                elif kind == 'merged':
+                    targets = rng.sample(rng.choice(polysemous), 2)
+                    row.update(lemma=targets[0]['lemma'], UMR='/'.join(t['UMR_id'] for t in targets),
+                               synset_id='/'.join(t['id_synset'] for t in targets))
+                row['example'] = rng.choice(texts)
+                synsets.update(row['synset_id'].split('/'))
+                writer.writerow(row)
+            written += min(chunk, n_rows - written)
+
+    with open(os.path.join(directory, 'wordnet.csv'), 'w', newline='') as output:
+        writer = csv.writer(output)
+        writer.writerow(['id_synset', 'definition'])
+        extra = [f'n#9{i:08d}' for i in range(args.wordnet_extra)]
+        for syn_id in sorted(synsets - {''}) + extra:
+            pos_tag, _, offset = syn_id.partition('#')
+            writer.writerow([f'http://lila-erc.eu/data/id/synset/{offset}-{pos_tag}', rng.choice(texts)])
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def run_script(directory, script, script_args, report):
+    """Run one of the scripts in directory with --profile, returning its wall time and stage report."""
+    command = [sys.executable, os.path.join(REPO, script), *script_args,
+               '--profile', report, '--no_trace_memory']
+    start = time.perf_counter()
+    subprocess.run(command, cwd=directory, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wall = time.perf_counter() - start
+    with open(os.path.join(directory, report), encoding='utf-8') as profile:
+        profile = json.load(profile)
+    return {'wall_s': wall, 'peak_rss_mib': profile['total']['peak_rss_mib'],
+            'stages': {name: stage['wall_s'] for name, stage in profile['stages'].items()}}
+
+
+def run_benchmark(n_rows, seeds, args):
+    directory = os.path.join(args.workdir, f'rows_{n_rows}_mapping_{args.mapping_scale}_seed_{args.seed}')
+    if args.regenerate or not os.path.exists(os.path.join(directory, 'wordnet.csv')):
+        start = time.perf_counter()
+        generate_inputs(directory, n_rows, seeds, args)
+        print(f"Generated {n_rows} rows in {directory} in {time.perf_counter() - start:.1f}s.", file=sys.stderr)
+
+    converter_args = ['--wordnet', 'wordnet.csv', '--mapping', 'mapping.tsv', '--vallex', 'vallex.tsv',
+                      *shlex.split(args.converter_args)]
+    converter = run_script(directory, 'converter.py', converter_args, 'converter_profile.json')
+    append = run_script(directory, 'append_sum_frames.py', [], 'append_profile.json')
+    return {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'rows': n_rows,
+        'mapping_scale': args.mapping_scale,
+        'wordnet_extra': args.wordnet_extra,
+        'converter_args': args.converter_args,
+        'full_build_s': converter['wall_s'] + append['wall_s'],
+        'converter': converter,
+        'append_sum_frames': append,
+    }
+
+
+def show(results_file):
+    """Print one line per recorded run, to compare builds across commits."""
+    print(f"{'commit':<16}{'date':<21}{'rows':>10}{'map':>5}{'build s':>10}{'conv s':>9}{'append s':>10}"
+          f"{'RSS MiB':>9}  converter args")
+    with open(results_file, encoding='utf-8') as results:
+        for line in results:
+            result = json.loads(line)
+            print(f"{str(result['commit']):<16}{result['date']:<21}{result['rows']:>10}{result['mapping_scale']:>5}"
+                  f"{result['full_build_s']:>10.2f}{result['converter']['wall_s']:>9.2f}"
+                  f"{result['append_sum_frames']['wall_s']:>10.2f}{result['converter']['peak_rss_mib'] or 0:>9.0f}"
+                  f"  {result['converter_args']}")
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+    if not args.show:
+        seeds = read_seeds()
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, 'a', encoding='utf-8') as results:
+            for n_rows in args.rows:
+                for _ in range(args.repeat):
+                    result = run_benchmark(n_rows, seeds, args)
+                    results.write(json.dumps(result) + '\n')
+                    results.flush()
+    show(args.results)
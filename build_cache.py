@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+On-disk cache for the resources parsed by converter.py.
+Each cached object is stored together with a key computed from the content of the files it was built from,
+so it is reused only as long as those files are unchanged.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+
+CACHE_VERSION = 5  # to be increased whenever the structure of the cached objects changes
+
+_hashes = {}  # hashes already computed in this run, as the same resource is part of several keys
+
+
+def file_hash(filename):
+    """Compute the SHA-256 of the content of a file."""
+    stat = os.stat(filename)
+    signature = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    if signature not in _hashes:
+        digest = hashlib.sha256()
+        with open(filename, mode='rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _hashes[signature] = digest.hexdigest()
+    return _hashes[signature]
+
+
+def cache_key(key_files):
+    """Combine the hashes of the files an object depends on (order matters) into a single key."""
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    for filename in key_files:
+        digest.update(file_hash(filename).encode())
+    return digest.hexdigest()
+
+
+def cache_path(cache_dir, name):
+    return os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', name) + '.pkl')
+
+
+def load(cache_dir, name, key_files):
+    """Return the object stored under name, or None if it is missing or its input files have changed."""
+    try:
+        with open(cache_path(cache_dir, name), mode='rb') as f:
+            key, obj = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    return obj if key == cache_key(key_files) else None
+
+
+def store(cache_dir, name, key_files, obj):
+    """Store obj under name, replacing any previous version."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, name)
+    with open(path + '.tmp', mode='wb') as f:
+        pickle.dump((cache_key(key_files), obj), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)  # never leave a truncated file behind
+
+
+def cached(cache_dir, name, key_files, build, *args):
+    """Return build(*args), reusing the stored result if cache_dir is given and key_files are unchanged."""
+    if not cache_dir:
+        return build(*args)
+    obj = load(cache_dir, name, key_files)
+    if obj is None:
+        obj = build(*args)
+        store(cache_dir, name, key_files, obj)
+    return obj
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Conflicts found while building Vallex4UMR (converter.py and append_sum_frames.py), e.g. occurrences of a UMR id
+annotated with roles different from those of its first occurrence.
+Each distinct conflict (kind, UMR id, value found, value expected) is recorded once, with the number of times it
+occurred and its first and last occurrence; a summary is printed at the end, and the full report can be written
+as JSON and text (option --conflicts).
+"""
+
+import json
+import os
+import sys
+
+KINDS = {
+    'roles': "roles different from those of the first occurrence",
+    'gramm_info': "gramm_info different from that of the first occurrence",
+    'sum_frames_roles': "frames of sum_habeo_frames.csv with roles different from those of the entry "
+                        "(added as -conflict entries)",
+}
+
+
+class ConflictCollector:
+    """Collects conflicts as compact records."""
+
+    def __init__(self):
+        self.records = {}  # (kind, UMR id, found, expected) -> [count, first occurrence, last occurrence]
+
+    def record(self, kind, umr_id, found, expected, occurrence):
+        key = (kind, sys.intern(umr_id), found, expected)
+        record = self.records.get(key)
+        if record is None:
+            self.records[key] = [1, occurrence, occurrence]
+        else:
+            record[0] += 1
+            record[2] = occurrence
+
+    def __len__(self):
+        return len(self.records)
+
+    def summary(self):
+        """Number of occurrences, distinct conflicts and UMR ids of each kind of conflict."""
+        summary = {}
+        for (kind, umr_id, _, _), (count, _, _) in self.records.items():
+            kind_summary = summary.setdefault(kind, {'occurrences': 0, 'conflicts': 0, 'ids': set()})
+            kind_summary['occurrences'] += count
+            kind_summary['conflicts'] += 1
+            kind_summary['ids'].add(umr_id)
+        return {kind: {**counts, 'ids': len(counts['ids'])} for kind, counts in summary.items()}
+
+    def report(self):
+        return {
+            'summary': self.summary(),
+            'conflicts': [{'kind': kind, 'UMR': umr_id, 'found': found, 'expected': expected, 'count': count,
+                           'first': first, 'last': last}
+                          for (kind, umr_id, found, expected), (count, first, last) in self.records.items()],
+        }
+
+    def format_summary(self):
+        """One line per kind of conflict."""
+        return '\n'.join(f"Conflicts: {counts['occurrences']} {KINDS.get(kind, kind)} "
+                         f"({counts['conflicts']} distinct, {counts['ids']} UMR ids)."
+                         for kind, counts in self.summary().items())
+
+    def format_report(self):
+        lines = [self.format_summary()]
+        for (kind, umr_id, found, expected), (count, first, last) in self.records.items():
+            occurrences = f"{first}" if count == 1 else f"{count} times, first {first}, last {last}"
+            lines.append(f"{kind}\t{umr_id}\t{found!r} VS. {expected!r}\t({occurrences})")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        """Write the JSON report, and the text one next to it (.txt)."""
+        with open(filename, 'w', encoding='utf-8') as output:
+            json.dump(self.report(), output, indent=2, ensure_ascii=False)
+        with open(os.path.splitext(filename)[0] + '.txt', 'w', encoding='utf-8') as output:
+            output.write(self.format_report())
+
+
+conflicts = ConflictCollector()
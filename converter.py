@@ -2,16 +2,81 @@
 # Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
 
 import csv
-import warnings
+import io
+import itertools
+import json
 import re
 import argparse
+import contextlib
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import build_cache
+from conflicts import conflicts
+from entry import Entry
+from external_sort import sort_records
+from functors import RoleMapper, load_hierarchy
+from inputs import expand_inputs, is_compressed, open_input
+from profiling import profiler
+from append_sum_frames import add_sum_frames, write_vallex4umr
+from lexicon import compile_text
+from sqlite_export import export_entries, export_text
+from text_index import write_index, write_shards
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--wordnet", required=True, help="Path to WordNet file.")
 parser.add_argument("--mapping", required=True, help="Path to file mapping UMR and Vallex2 entries.")
 parser.add_argument("--vallex", required=True, help="Path to Vallex2 file.")
-
+parser.add_argument("--inputs", nargs='+', help="Annotation files, or glob patterns (e.g. 'files/frames_*.csv.gz'), "
+                                                "in the order they are read; default: the files in files_26.8.24.")
+parser.add_argument("--input_manifest", action='append', help="File listing the annotation files (or glob patterns), "
+                                                              "one per line, relative to the manifest.")
+parser.add_argument("--sum_frames", help="Path to the sum/habeo frames file (e.g. sum_habeo_frames.csv). "
+                                         "If given, the frames are merged in memory, as append_sum_frames.py would do.")
+parser.add_argument("--jobs", type=int, default=1, help="Number of processes used to read the annotation files.")
+parser.add_argument("--cache_dir", help="Directory where parsed resources are cached and reused while their files "
+                                        "are unchanged (disabled if not given).")
+parser.add_argument("--wordnet_loading", choices=['full', 'needed', 'indexed'], default='full',
+                    help="Keep all WordNet definitions (full), or only those of the synsets occurring in the annotation "
+                         "files and in the mapping, either by reading the whole file (needed) or by reading only their "
+                         "rows through an index of WordNet stored in --cache_dir (indexed).")
+parser.add_argument("--loading", choices=['serial', 'threads', 'processes'], default='serial',
+                    help="Load WordNet, the mapping and Vallex2 one after the other (serial), or concurrently "
+                         "in a pool of threads or processes, while the annotation files are being read.")
+parser.add_argument("--sort_buffer", type=int, help="Number of entries sorted in memory when writing the output; "
+                                                   "beyond that, sorted runs are merged from temporary files.")
+parser.add_argument("--binary", action='store_true', help="Also write the lexicon in compiled form (Vallex4UMR.bin), "
+                                                           "to be queried with lexicon.Lexicon.")
+parser.add_argument("--functor_hierarchy", help="File with the hierarchy of the functors used to number the "
+                                                "PropBank roles, one functor per line (as in tecto2umr's "
+                                                "default-functors-to-umrlabels.txt); default: built-in hierarchy.")
+parser.add_argument("--sqlite", help="Also write the lexicon to a SQLite database at this path (see sqlite_export.py).")
+parser.add_argument("--index", action='store_true', help="Also write the byte offsets of each entry and lemma in "
+                                                          "Vallex4UMR.txt to Vallex4UMR.txt.idx (see text_index.py).")
+parser.add_argument("--shard_dir", help="Also split Vallex4UMR.txt by lemma initial into this directory, with a "
+                                        "manifest and an index per shard.")
+parser.add_argument("--validate", help="Validate the annotation files and the mapping, and write the report (dropped "
+                                        "and suspicious rows, with file and line) as JSON to this path.")
+parser.add_argument("--conflicts", help="Path of a JSON report of the conflicts between occurrences of the same UMR "
+                                         "id (a text version is written next to it, with .txt extension).")
+parser.add_argument("--profile", help="Path of a JSON report with time, memory and counts of each stage of the build.")
+parser.add_argument("--cprofile", action='store_true', help="With --profile, also run cProfile: the hottest functions "
+                                                            "are added to the report, and all stats saved as .prof.")
+parser.add_argument("--no_trace_memory", action='store_true', help="With --profile, do not trace memory allocations "
+                                                                   "(tracemalloc slows the build down); only peak RSS "
+                                                                   "is recorded.")
+
+
+default_input_files = [
+    'files_26.8.24/frames_Sallust_1-10.csv',
+    'files_26.8.24/frames_Sallust_11-20.csv',
+    'files_26.8.24/frames_Sallust_21-30.csv',
+    'files_26.8.24/frames_Sallust_31-40.csv',
+    'files_26.8.24/frames_Sallust_41-51.csv',
+    'files_26.8.24/frames_Sallust_52-61.csv'
+]
 
 pos = {
     'a': 'ADJ',
@@ -20,240 +85,719 @@ pos = {
     'r': 'ADV',
 }
 
+role_mapper = RoleMapper()  # see roles_to_propbank()
+
+
 def split_key(key):
     alpha_part, num_part = key.rsplit('-', 1)
     return alpha_part, int(num_part)
 
 
-def control(umr_entry):
-    # TODO: verify that entries are well-formed.
-    pass
+# Well-formed entries:
+# 1. standard patterns (dico-01, dico2-01, dico-NEW-23)
+# 2. merged entries (polliceor-01/polliceor-02)
+well_formed_umr_id = re.compile(r"^[a-zA-Z]+(\d)?(-NEW)?-\d{2}(/[a-zA-Z]+(\d)?(-NEW)?-\d{2})*$")
+# Other fields checked by control(): comma-separated functors (e.g. "ACT, PAT"), synset ids (v#01234567, /-joined for
+# merged entries), LiLa lemma ids in the annotation (12345) and LiLa URIs in the mapping
+well_formed_functors = re.compile(r"^\s*(---|[A-Z][A-Z0-9]*)(\s*,\s*(---|[A-Z][A-Z0-9]*))*\s*$")
+well_formed_synset_id = re.compile(r"^[nvar]#\d{8}(/[nvar]#\d{8})*$")
+well_formed_lila_id = re.compile(r"^\d+$")
+well_formed_lila_uri = re.compile(r"^http://lila-erc\.eu/data/id/(lemma|hypolemma)/(\d+)$")
+
+
+def is_well_formed(umr_entry):
+    return well_formed_umr_id.match(umr_entry) is not None
+
+
+def control(row, mapping):
+    """
+    Verify that an annotation row is well-formed and consistent with the mapping.
+    Returns the problems found, as (severity, check, message), where severity is:
+    - 'dropped': the row is ignored by the build (UMR id not well-formed);
+    - 'error': the build fails on the row (functor not in the hierarchy);
+    - 'suspicious': the row is used, but is probably wrong.
+    """
+    umr_entry = row['UMR']
+    if not is_well_formed(umr_entry):
+        return [('dropped', 'umr_id', f"UMR id not well-formed: {umr_entry!r}")]
+
+    problems = []
+    roles = row['roles']
+    if not roles.strip():
+        problems.append(('suspicious', 'roles', "no roles"))
+    elif not well_formed_functors.match(roles):
+        problems.append(('suspicious', 'roles', f"roles not well-formed: {roles!r}"))
+    for functor in roles.split(','):
+        functor = functor.strip()
+        if functor not in ('---', '') and functor not in role_mapper.ranks:
+            problems.append(('error', 'roles', f"functor not in the hierarchy: {functor!r}"))
+
+    synset_id = row['synset_id']
+    if synset_id and not well_formed_synset_id.match(synset_id):
+        problems.append(('suspicious', 'synset_id', f"synset id not well-formed: {synset_id!r}"))
+    lila_id = row['URI lemma']
+    if lila_id and not well_formed_lila_id.match(lila_id):
+        problems.append(('suspicious', 'lemma_URI', f"LiLa lemma id not well-formed: {lila_id!r}"))
+    elif not lila_id and not retrieve_uri(umr_entry, mapping):
+        problems.append(('suspicious', 'lemma_URI', "no LiLa lemma id, neither in the row nor in the mapping"))
+
+    # Cross-check with the mapping (-NEW entries are not in it)
+    sub_entries, sub_synsets = umr_entry.split('/'), synset_id.strip().split('/')
+    if synset_id.strip() and len(sub_synsets) != len(sub_entries):
+        problems.append(('suspicious', 'synset_id', f"{len(sub_synsets)} synset ids ({synset_id!r}) "
+                                                    f"for {len(sub_entries)} UMR ids"))
+    for sub_entry, sub_synset in itertools.zip_longest(sub_entries, sub_synsets):
+        if sub_entry is None or 'NEW' in sub_entry:  # more synset ids than UMR ids, reported above
+            continue
+        mapped = mapping['rows'].get(sub_entry)
+        if mapped is None:
+            problems.append(('suspicious', 'mapping', f"{sub_entry} is not in the mapping"))
+            continue
+        if sub_synset and sub_synset != mapped['id_synset']:
+            problems.append(('suspicious', 'mapping', f"synset {sub_synset} of {sub_entry} is "
+                                                      f"{mapped['id_synset']} in the mapping"))
+        uri = well_formed_lila_uri.match(mapped['uri'])
+        if lila_id and uri and lila_id != uri.group(2):
+            problems.append(('suspicious', 'mapping', f"LiLa lemma {lila_id} of {sub_entry} is "
+                                                      f"{mapped['uri']} in the mapping"))
+    return problems
+
+
+def control_file(file_path, mapping):
+    """Run control() on the rows of an annotation file; returns the problems found, with the line of each row."""
+    problems = []
+    with open_input(file_path) as infile:
+        reader = csv.DictReader(infile)
+        for row in reader:
+            if 'Par.' in row['id'] or row['UMR'].endswith('-91'):  # skipped by read_annotations() on purpose
+                continue
+            problems.extend({'file': file_path, 'line': reader.line_num, 'LDT_id': row['id'], 'UMR': row['UMR'],
+                             'severity': severity, 'check': check, 'message': message}
+                            for severity, check, message in control(row, mapping))
+    return problems
+
+
+def control_mapping(mapping_file):
+    """Verify that the UMR ids, synset ids and LiLa URIs of the mapping are well-formed."""
+    problems = []
+    with open_input(mapping_file) as mapping_rows:
+        reader = csv.reader(mapping_rows, delimiter='\t')
+        header = next(reader)
+        umr_column = header.index('UMR_id')
+        checks = [('umr_id', umr_column, well_formed_umr_id.match),
+                  ('synset_id', header.index('id_synset'), well_formed_synset_id.match),
+                  ('lemma_URI', header.index('uri'), well_formed_lila_uri.match)]
+        for row in reader:
+            for check, column, match in checks:
+                if match(row[column]) is None:
+                    problems.append({'file': mapping_file, 'line': reader.line_num, 'LDT_id': None,
+                                     'UMR': row[umr_column], 'severity': 'suspicious', 'check': check,
+                                     'message': f"not well-formed: {row[column]!r}"})
+    return problems
+
+
+def control_in_worker(file_path):
+    return control_file(file_path, worker_resources[1])
+
+
+def validate(input_files, mapping_file, mapping, jobs=1):
+    """
+    Validate the annotation files (in parallel, one process per file, if jobs > 1) and the mapping.
+    Returns a report with the number of problems by severity and check, and the problems themselves.
+    """
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(None, mapping, role_mapper.hierarchy)) as executor:
+            mapping_problems = executor.submit(control_mapping, mapping_file)
+            problems = [problem for found in executor.map(control_in_worker, input_files) for problem in found]
+            problems.extend(mapping_problems.result())
+    else:
+        problems = [problem for file_path in input_files for problem in control_file(file_path, mapping)]
+        problems.extend(control_mapping(mapping_file))
+
+    summary = {}
+    for problem in problems:
+        by_check = summary.setdefault(problem['severity'], {})
+        by_check[problem['check']] = by_check.get(problem['check'], 0) + 1
+    return {'files': [*input_files, mapping_file], 'summary': summary, 'problems': problems}
+
 
+def wordnet_synset_id(wordnet_id):
+    """Convert a WordNet synset id (e.g. http://.../n-01234567) to the one used in the annotation (n#01234567)."""
+    syn_id = wordnet_id.split('/')[-1].split('-')
+    return syn_id[1] + '#' + syn_id[0]
 
-def store_wordnet(filename):
-    """Storing WordNet synsets given the WordNet file path."""
+
+def store_wordnet(filename, needed=None):
+    """
+    Storing WordNet synsets given the WordNet file path.
+    If a set of needed synset ids is given, the definitions of the other synsets are not kept.
+    """
     defs = {}
-    with open(filename, mode='r') as wordnet:
+    with open_input(filename) as wordnet:
         for row in csv.DictReader(wordnet):
-            syn_id = row['id_synset'].split('/')[-1].split('-')
-            syn_id = syn_id[1] + '#' + syn_id[0]
-            defs[syn_id] = row['definition']
+            syn_id = wordnet_synset_id(row['id_synset'])
+            if needed is None or syn_id in needed:
+                defs[syn_id] = row['definition']
         return defs
 
 
+def csv_records(binary_file):
+    """Yield the byte offset and the raw bytes of each CSV record, including records spanning several lines."""
+    offset = binary_file.tell()
+    record = b''
+    for line in binary_file:
+        record += line
+        if record.count(b'"') % 2 == 0:  # quoted fields are closed
+            yield offset, record
+            offset += len(record)
+            record = b''
+    if record:
+        yield offset, record
+
+
+def index_wordnet(filename):
+    """Map each synset id to the byte offset and length of its row in the WordNet file."""
+    index = {}
+    with open(filename, mode='rb') as wordnet:
+        header = next(csv.reader([wordnet.readline().decode('utf-8')]))
+        column = header.index('id_synset')
+        for offset, record in csv_records(wordnet):
+            row = next(csv.reader(io.StringIO(record.decode('utf-8'))), None)
+            if row:
+                index[wordnet_synset_id(row[column])] = (offset, len(record))
+    return {'header': header, 'offsets': index}
+
+
+def store_wordnet_indexed(filename, index, needed):
+    """Storing the definitions of the needed synsets only, reading their rows through index_wordnet()."""
+    defs = {}
+    offsets = sorted(index['offsets'][syn_id] for syn_id in needed if syn_id in index['offsets'])
+    with open(filename, mode='rb') as wordnet:
+        for offset, length in offsets:  # in file order, so that seeks only move forward
+            wordnet.seek(offset)
+            record = wordnet.read(length).decode('utf-8')
+            row = next(csv.DictReader(io.StringIO(record), fieldnames=index['header']))
+            defs[wordnet_synset_id(row['id_synset'])] = row['definition']
+    return defs
+
+
+def load_wordnet(filename, loading='full', cache_dir=None, needed=None):
+    """Storing WordNet definitions, according to the --wordnet_loading mode (needed synsets are required if not full)."""
+    if loading == 'full':
+        return build_cache.cached(cache_dir, 'wordnet', [filename], store_wordnet, filename)
+    if loading == 'needed':
+        return store_wordnet(filename, needed)
+    wordnet_index = build_cache.cached(cache_dir, 'wordnet-index', [filename], index_wordnet, filename)
+    return store_wordnet_indexed(filename, wordnet_index, needed)
+
+
+def collect_synset_ids(input_files, mapping):
+    """Collect the synset ids whose definition may be needed, from the annotation files and the mapping."""
+    needed = set()
+    for row in mapping['rows'].values():
+        needed.update(row['id_synset'].split('/'))
+    for file_path in input_files:
+        with open_input(file_path) as infile:
+            for row in csv.DictReader(infile):
+                needed.update(row['synset_id'].split('/'))  # merged entries have /-joined synset ids
+    return needed
+
+
 def retrieve_synset_def(syn_id, defs):
     """Function to retrieve the synset definition given the synset id,
     or the brand-new definition created when a WN synset was not available."""
     return " + ".join([defs.get(s, 'Unknown') for s in syn_id.split('/')])
 
 
-def store_uris_from_mapping(mapping_file):
-    with open(mapping_file, mode='r') as mapping:
-        return {row['UMR_id']: row['uri'] for row in csv.DictReader(mapping, delimiter='\t')}
-
-
-def retrieve_uri(umr_entry, stored_uris):
+def memory_size(obj):
+    """Approximate memory used by obj and by the objects it contains (dicts, lists, sets, strings)."""
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set)):
+            stack.extend(item)
+    return size
+
+
+def load_mapping(mapping_file, measure_memory=False):
+    """
+    Read the file mapping UMR and Vallex2 entries once, and build all the indexes needed by the pipeline:
+    - 'rows': UMR id -> mapping row;
+    - 'uris': UMR id -> lemma URI;
+    - 'new_uris': lemma -> lemma URI, for -NEW entries (taken from the -01 entry of the lemma);
+    - 'vallex_keys': UMR id -> key of its arguments set in Vallex2 (see store_vallex()).
+    Parse time is reported on stderr, together with the memory used by the indexes if measure_memory
+    (as with --profile: walking them takes longer than parsing the file).
+    """
+    start = time.perf_counter()
+
+    mapping = {'rows': {}, 'uris': {}, 'new_uris': {}, 'vallex_keys': {}}
+    with open_input(mapping_file) as mapping_rows:
+        for row in csv.DictReader(mapping_rows, delimiter='\t'):
+            umr_id = row['UMR_id']
+            mapping['rows'][umr_id] = row
+            mapping['uris'][umr_id] = row['uri']
+            mapping['vallex_keys'][umr_id] = f"{row['uri']}+{row['id_synset']}"
+    for umr_id, uri in mapping['uris'].items():
+        if umr_id.endswith('-01'):
+            mapping['new_uris'][umr_id[:-len('-01')]] = uri
+
+    message = f"Mapping: {len(mapping['rows'])} entries read from {mapping_file} in {time.perf_counter() - start:.2f}s"
+    if measure_memory:
+        start = time.perf_counter()
+        size = memory_size(mapping)
+        message += f" ({size / 2**20:.1f} MiB, measured in {time.perf_counter() - start:.2f}s)"
+    print(message + '.', file=sys.stderr)
+    return mapping
+
+
+def retrieve_uri(umr_entry, mapping):
     """Function to retrieve the URI given the UMR id."""
     # Handle merged entries: get the first part before the first '/'
-    base_entry = umr_entry.split('/')[0]
+    base_entry = umr_entry.split('/', 1)[0]
     if 'NEW' in base_entry:
-        base_entry = base_entry.split('-')[0] + "-01"  # the URI is shared for the same lemma, so any word sense is fine
-    return stored_uris.get(base_entry)
+        # the URI is shared for the same lemma, so any word sense (here -01) is fine
+        return mapping['new_uris'].get(base_entry.split('-', 1)[0])
+    return mapping['uris'].get(base_entry)
 
 
-def create_entries(infos, row):
+def create_entries(infos, row, par, definitions, mapping, collector=conflicts, rows=None):
+    """
+    Add an annotation row to the entry of its UMR id, creating the entry at its first occurrence.
+    Mismatches with the first occurrence are recorded by the collector or, if rows is given, the roles, gramm_info
+    and LDT id of the row are appended to it instead, to be checked later by merge_entries().
+    """
     mpd_entry = row['UMR']
+    roles = None
     if mpd_entry not in infos:
         # Create the entry for Vallex4UMR, by first extracting the UMR key
-        synset_def = retrieve_synset_def(row['synset_id'], definitions)
-        uri = retrieve_uri(mpd_entry, uris)
-        infos[mpd_entry] = {
-            # Lists/sets are used in case it is necessary to add more than one id to a same entry
-            'LDT_id': [row['id'] + f' (par.{par})'],
-            'v1_frame': {row['V1 frame'].replace('#', '_')},
-            'example': {row['example']},
-            'roles': roles_to_propbank([role.strip() for role in row['roles'].split(',')]),
-            'lemma': row['lemma'],
-            'synset_id': row['synset_id'].replace('#', '_') if row['synset_id'] else 'NA',
-            'URI_lemma': uri if uri else 'http://lila-erc.eu/data/id/lemma/'+row['URI lemma'],
-            'definition': synset_def if synset_def != 'Unknown' else row['definition'],
-            'POS': pos.get(row['synset_id'].split('#')[0], 'NA'),
-            'gramm_info': row['gramm_info']  # conflicts are checked by the warning, so no need of list
-        }
+        if definitions is None:
+            # WordNet is still loading: the definition is filled in later by resolve_definitions()
+            definition = (row['synset_id'], row['definition'])
+        else:
+            synset_def = retrieve_synset_def(row['synset_id'], definitions)
+            definition = synset_def if synset_def != 'Unknown' else row['definition']
+        uri = retrieve_uri(mpd_entry, mapping)
+        infos[mpd_entry] = Entry(
+            lemma=row['lemma'],
+            synset_id=row['synset_id'].replace('#', '_') if row['synset_id'] else 'NA',
+            URI_lemma=uri if uri else 'http://lila-erc.eu/data/id/lemma/'+row['URI lemma'],
+            definition=definition,
+            POS=pos.get(row['synset_id'].split('#')[0], 'NA'),
+            roles=roles_to_propbank([role.strip() for role in row['roles'].split(',')]),
+            gramm_info=row['gramm_info'],  # conflicts are recorded by the collector, so no need of list
+            # Lists/ordered dicts are used in case it is necessary to add more than one id to a same entry.
+            LDT_id=[row['id'] + f' (par.{par})'],
+            v1_frame=dict.fromkeys([row['V1 frame'].replace('#', '_')]),
+            example=dict.fromkeys([row['example']]),
+        )
     else:
-        infos[mpd_entry]['LDT_id'].append(lines['id'] + f' (par.{par})')
-        infos[mpd_entry]['v1_frame'].add(lines['V1 frame'].replace('#', '_'))
-        infos[mpd_entry]['example'].add(lines['example'])
+        info = infos[mpd_entry]
+        info.LDT_id.append(row['id'] + f' (par.{par})')
+        info.v1_frame[row['V1 frame'].replace('#', '_')] = None
+        info.example[row['example']] = None
         # lemma, synset_id, URI_lemma, definition will be the same.
-        if roles_to_propbank([role.strip() for role in lines['roles'].split(',')]) != infos[mpd_entry]['roles']:
-            warnings.warn(f"Mismatch in roles:{lines['roles']} VS. {infos[mpd_entry]['roles']}."
-                          f"Check the entry with LDT id {lines['id']} and {infos[mpd_entry]['LDT_id']}.")
-        if lines['gramm_info'] != infos[mpd_entry]['gramm_info']:
-            warnings.warn(f"Mismatch in gramm_info:{lines['gramm_info']} VS. {infos[mpd_entry]['gramm_info']}."
-                          f"Check the entry with LDT id {lines['id']} and {infos[mpd_entry]['LDT_id']}.")
+        roles = roles_to_propbank([role.strip() for role in row['roles'].split(',')])
+        if rows is None:
+            if roles != info.roles:
+                collector.record('roles', mpd_entry, roles, info.roles, info.LDT_id[-1])
+            if row['gramm_info'] != info.gramm_info:
+                collector.record('gramm_info', mpd_entry, row['gramm_info'], info.gramm_info, info.LDT_id[-1])
+    if rows is not None:
+        info = infos[mpd_entry]
+        rows.append((mpd_entry, info.roles if roles is None else roles, row['gramm_info'], info.LDT_id[-1]))
     return infos
 
 
-def format_info(info, all_entries_info, full=True):
-    """Format the information for a *single entry* before printing it out."""
+def read_annotations(file_path, definitions, mapping, infos=None, collector=conflicts, rows=None):
+    """
+    Create the entries for a single annotation file (frames_Sallust_*.csv).
+    If no infos are given, a new partial table is returned, to be combined later with merge_entries()
+    (together with the rows, see create_entries()).
+    If definitions are None (WordNet not loaded yet), resolve_definitions() must be called on the entries.
+    Mismatches between occurrences of the same UMR id are recorded by the collector.
+    """
+    infos = {} if infos is None else infos
+    par = None
+    with open_input(file_path) as infile:
+        for lines in csv.DictReader(infile):
+            if 'Par.' in lines['id']:
+                par = lines['id'].split(' ')[-1]
+                continue
+            # Ignore entries annotated as UMR abstract predicates
+            if lines['UMR'].endswith('-91'):
+                continue
+            # Consider only well-formed entries
+            if is_well_formed(lines["UMR"]):
+                create_entries(infos, lines, par, definitions, mapping, collector, rows)
+    return infos
+
 
-    backup_key = info['entry'].split('-')[0] + '-01'  # to retrieve POS for entries with no synset
-    if backup_key in all_entries_info:
-        backup_key = backup_key
+def merge_entries(infos, partial, collector=conflicts):
+    """
+    Merge a partial table, as returned by read_partial_tables() with the rows it was read from, into infos.
+    Partial tables must be merged in the same order as the input files, so that the result (including the
+    conflicts found) is identical to reading all the files into one table: each row is checked against the first
+    occurrence of its UMR id in all the files read so far, and mismatches are recorded by the collector.
+    """
+    table, rows = partial
+    merged = set()
+    for mpd_entry, roles, gramm_info, ldt_id in rows:
+        info = table[mpd_entry]
+        existing = infos.get(mpd_entry)
+        if existing is None:  # first occurrence
+            infos[mpd_entry] = info
+            continue
+        if roles != existing.roles:
+            collector.record('roles', mpd_entry, roles, existing.roles, ldt_id)
+        if gramm_info != existing.gramm_info:
+            collector.record('gramm_info', mpd_entry, gramm_info, existing.gramm_info, ldt_id)
+        if existing is not info and mpd_entry not in merged:
+            merged.add(mpd_entry)
+            existing.LDT_id.extend(info.LDT_id)
+            existing.v1_frame.update(info.v1_frame)
+            existing.example.update(info.example)
+    return infos
+
+
+def read_partial_tables(input_files, definitions, mapping, jobs=1, cache_dir=None, resource_files=()):
+    """
+    Read each annotation file into its own partial table, returned with its rows (see create_entries())
+    in the order of input_files. If cache_dir is given, the tables of files that are unchanged
+    (together with resource_files) are reused.
+    """
+    partials = {}
+    if cache_dir:
+        for file_path in input_files:
+            partials[file_path] = build_cache.load(cache_dir, file_path, [file_path, *resource_files])
+    missing = [file_path for file_path in input_files if partials.get(file_path) is None]
+
+    if jobs > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(definitions, mapping, role_mapper.hierarchy)) as executor:
+            partials.update(zip(missing, executor.map(read_annotations_in_worker, missing)))
     else:
-        backup_key = None
+        partials.update((file_path, read_annotations_in_worker(file_path, definitions, mapping))
+                        for file_path in missing)
+
+    if cache_dir:
+        # Stored before merging, since merge_entries() modifies the first tables in place
+        for file_path in missing:
+            build_cache.store(cache_dir, file_path, [file_path, *resource_files], partials[file_path])
+    return [partials[file_path] for file_path in input_files]
+
+
+worker_resources = ()
+
+
+def init_worker(definitions, mapping, hierarchy=None):
+    """Make the resources loaded by the main process (and its functor hierarchy) available to the worker processes."""
+    global worker_resources, role_mapper
+    worker_resources = (definitions, mapping)
+    role_mapper = RoleMapper(hierarchy)
+
+
+def read_annotations_in_worker(file_path, *resources):
+    """Read an annotation file into a partial table; returns it with its rows, checked by merge_entries()."""
+    rows = []
+    return read_annotations(file_path, *(resources or worker_resources), rows=rows), rows
+
+
+def resolve_definitions(infos, definitions):
+    """Fill in the definitions of the entries created by create_entries() before WordNet was loaded."""
+    for info in infos.values():
+        if isinstance(info.definition, tuple):
+            syn_id, fallback = info.definition
+            synset_def = retrieve_synset_def(syn_id, definitions)
+            info.definition = synset_def if synset_def != 'Unknown' else fallback
+    return infos
+
+
+def timed_load(name, load, *args):
+    """Run load(*args), printing how long it took on stderr."""
+    start = time.perf_counter()
+    resource = load(*args)
+    print(f"{name}: loaded in {time.perf_counter() - start:.2f}s.", file=sys.stderr)
+    return resource
+
+
+def submit(executor, load, *args):
+    """Submit load(*args) to executor, or run it right away (returning a completed future) if there is none."""
+    if executor is not None:
+        return executor.submit(load, *args)
+    future = Future()
+    future.set_result(load(*args))
+    return future
+
+
+def retrieve_pos(entry, info, all_entries_info):
+    """Function to retrieve the POS of an entry, falling back on the -01 entry of the same lemma."""
+    if info.POS != 'NA':
+        return info.POS
+    backup_key = entry.split('-')[0] + '-01'  # to retrieve POS for entries with no synset
+    return all_entries_info[backup_key].POS if backup_key in all_entries_info else 'NA'
+
+
+def format_info(entry, info, all_entries_info, full=True):
+    """Format the information for a *single entry* before printing it out."""
 
     # Basic information that is always included
-    gramm_info_line = f" \t-gramm_info: {info.get('gramm_info')}\n" if info.get('gramm_info') else ''
+    gramm_info_line = f" \t-gramm_info: {info.gramm_info}\n" if info.gramm_info else ''
     formatted_info = (
-        f": id: {info.get('entry', 'NA')}\n"
-        f" + {info.get('roles', 'NA')}\n"
-        f" \t-synset_id: {info.get('synset_id', 'NA')}\n"
-        f" \t-synset_definition: {info.get('definition', 'NA')}\n"
-        f" \t-lemma_URI: {info.get('URI_lemma', 'NA')}\n"
-        f" \t-POS: {info.get('POS') if info.get('POS') != 'NA' else (all_entries_info[backup_key].get('POS', 'NA') if backup_key is not None else 'NA')}\n"
+        f": id: {entry}\n"
+        f" + {info.roles}\n"
+        f" \t-synset_id: {info.synset_id}\n"
+        f" \t-synset_definition: {info.definition}\n"
+        f" \t-lemma_URI: {info.URI_lemma}\n"
+        f" \t-POS: {retrieve_pos(entry, info, all_entries_info)}\n"
         f"{gramm_info_line}"
     )
 
     # Additional information only included if full is True
     if full:
         formatted_info += (
-            f" \t-Vallex1_id: {'; '.join(info.get('v1_frame', []))}\n"
-            f" \t-example: {'; '.join(info.get('example', []))}\n"
-            f" \t-LDT_ids: {'; '.join(info.get('LDT_id', []))}\n"
+            f" \t-Vallex1_id: {'; '.join(info.v1_frame or [])}\n"
+            f" \t-example: {'; '.join(info.example or [])}\n"
+            f" \t-LDT_ids: {'; '.join(info.LDT_id or [])}\n"
         )
 
     return formatted_info
 
 
+def merged_sub_entries(infos):
+    """Single entries that are part of merged ones, e.g. cupiditas-01 and cupiditas-02 for cupiditas-01/cupiditas-02."""
+    return {sub_entry for entry in infos if '/' in entry for sub_entry in entry.split('/')}
+
+
 def remove_duplicates(infos):
     """
     Remove single entries that are part of merged ones, to avoid repetition.
     E.g., cupiditas-01 and cupiditas-02, as they have been merged as cupiditas-01/cupiditas-02.
     """
-    # Reorder infos so that merged entries occur first.
-    infos = dict(sorted(infos.items(), key=lambda item: ('/' not in item[0], item[0])))
+    processed = merged_sub_entries(infos)
+    return {key: infos[key] for key in sorted(infos) if key not in processed}
 
-    processed = set()
-    for entry, info in infos.items():
-            if '/' in entry:
-                for sub_entry in entry.split('/'):
-                    processed.add(sub_entry)
 
-    return {key: infos[key] for key in sorted(infos) if key not in processed}
+def process_entries(infos, output_file, max_in_memory=None, tmp_dir=None):
+    """
+    Process and print all entries, sorted by UMR id and without the single entries that are part of merged ones
+    (as remove_duplicates() does, in the same pass). Each entry is formatted as soon as it is read, and the formatted
+    entries are sorted in memory or, beyond max_in_memory entries, on disk (see external_sort.py).
+    """
+    processed = merged_sub_entries(infos)
+    # retrieve_pos() only looks up -01 entries in the other entries
+    backup_entries = {entry: info for entry, info in infos.items() if entry.endswith('-01') and entry not in processed}
 
+    def formatted_entries():
+        for entry, info in infos.items():
+            if entry not in processed:
+                header = f"* {entry.split('-')[0].upper()}\n"
+                entry_info = format_info(entry, info, backup_entries, full=bool(info.LDT_id))
+                yield entry, f"{header} {entry_info}\n"  # as print(header, entry_info)
 
-def process_entries(infos, output_file):
-    """Process and print all entries in filtered_infos."""
+    for _, entry_text in sort_records(formatted_entries(), max_in_memory, tmp_dir):
+        output_file.write(entry_text)
+
+
+def to_sum_frames_entries(infos):
+    """
+    Convert the entries to the structure built by append_sum_frames.read_vallex4umr(),
+    i.e. what would be read back from the printed Vallex4UMR file.
+    """
+    entries = {}
     for entry, info in infos.items():
-        header = f"* {entry.split('-')[0].upper()}\n"
-        entry_info = format_info({**info, 'entry': entry}, infos, full='LDT_id' in info and bool(info.get('LDT_id')))
-        print(header, entry_info, file=output_file)
+        entries[entry] = {
+            'lemma': entry.split('-')[0].upper(),
+            'roles': info.roles.strip(),
+            'synset_id': info.synset_id.strip(),
+            'synset_definition': info.definition.strip(),
+            'lemma_URI': info.URI_lemma.strip(),
+            'POS': retrieve_pos(entry, info, infos).strip(),
+        }
+        if info.gramm_info:
+            entries[entry]['gramm_info'] = info.gramm_info.strip()
+        if info.LDT_id:
+            entries[entry]['frames'] = '; '.join(info.v1_frame).strip().split('; ')
+            entries[entry]['examples'] = '; '.join(info.example).strip().split('; ')
+            entries[entry]['LDT_ids'] = '; '.join(info.LDT_id).strip().split('; ')
+    return entries
+
 
+def store_vallex(vallex):
+    """Storing the Vallex2 arguments sets, by lemma URI and synset id."""
+    with open_input(vallex) as val:
+        return {f"{row['uri']}+{row['id_synset']}": row['arguments_set'] for row in csv.DictReader(val, delimiter='\t')}
 
-def populate_other_entries(mapping_file, vallex, infos):
+
+def populate_other_entries(mapping, definitions, stored_vallex, infos):
     """
     Function to create entries for which no occurrences in the text have been found.
-    Based on the mapping between UMR and Vallex2.
-    Roles (e.g. ACT, PAT) are taken from Vallex2.
+    Based on the mapping between UMR and Vallex2 (as returned by load_mapping()).
+    Roles (e.g. ACT, PAT) are taken from Vallex2 (as returned by store_vallex()).
     """
-    with open(mapping_file, mode='r') as mapping, open(vallex, mode='r') as val:
-        stored_vallex = {f"{row['uri']}+{row['id_synset']}": row['arguments_set'] for row in csv.DictReader(val, delimiter='\t')}
-        storage = {
-            row['UMR_id']: {
-                'lemma': row['lemma'],
-                'synset_id': row['id_synset'].replace('#', '_'),
-                'URI_lemma': row['uri'],
-                'definition': retrieve_synset_def(row['id_synset'], definitions),
-                'POS': pos.get(row['id_synset'].split('#')[0], 'NA'),
-                'roles': roles_to_propbank(stored_vallex.get(f"{row['uri']}+{row['id_synset']}").split(','))
-            }
-            for row in csv.DictReader(mapping, delimiter='\t')}
+    # merge the 'non-observed' entries with the main ones from create_entries()
+    for umr_id, row in mapping['rows'].items():
+        if umr_id not in infos:
+            infos[umr_id] = Entry(
+                lemma=row['lemma'],
+                synset_id=row['id_synset'].replace('#', '_'),
+                URI_lemma=row['uri'],
+                definition=retrieve_synset_def(row['id_synset'], definitions),
+                POS=pos.get(row['id_synset'].split('#')[0], 'NA'),
+                roles=roles_to_propbank(stored_vallex.get(mapping['vallex_keys'][umr_id]).split(','))
+            )
 
-        # merge the 'non-observed' entries with the main ones from create_entries()
-        for umr_id, data in storage.items():
-            if umr_id not in infos:
-                infos[umr_id] = data
-
-        return infos
+    return infos
 
 
 def roles_to_propbank(roles: list):
     """
     Function to convert ACT/PAT/... functors to ARG0/ARG1/... PropBank roles.
     Based on a custom hierarchy (cf. default mapping available at
-    https://github.com/ufal/UMR/blob/main/tecto2umr/dafault-functors-to-umrlabels.txt).
-    Only ACT and PAT are fixed (ARG0 and ARG1, respectively). Arguments follow, then adjuncts.
+    https://github.com/ufal/UMR/blob/main/tecto2umr/dafault-functors-to-umrlabels.txt), or on the one given
+    with --functor_hierarchy. Only ACT and PAT are fixed (ARG0 and ARG1, respectively). Arguments follow, then adjuncts.
+    The roles of each combination of functors are cached by role_mapper (see functors.py).
     """
-    functor_hierarchy = [
-        'ACT', 'PAT', 'ADDR', 'EFF', 'ORIG', 'BEN', 'DIFF', 'REG', 'MANN', 'DIR1', 'DIR3', 'DIR2', 'LOC',
-        'TOWH', 'TFHL', 'TWHEN', 'MEANS', 'EXT', 'AIM', 'MAT', 'INTT', 'CAUS', 'CPR', 'APP', 'ACMP'
-    ]
-
-    # sorted_functors = sorted(f for f in roles if f.strip() not in ['---', ''])
-    functors = [f for f in roles if f.strip() not in ['---', '']]
-    pb_roles = []
-
-    current_arg = 1  # ARG0 will be only for ACT anyway
-
-    # Always assign ACT to ARG0, PAT to ARG1, and ADDR to ARG2 (?) if they are present
-    if 'ACT' in functors:
-        pb_roles.append("ACT [ARG0]")
-        functors.remove('ACT')
-    if 'PAT' in functors:
-        pb_roles.append("PAT [ARG1]")
-        functors.remove('PAT')
-        current_arg += 1
-    if 'ADDR' in functors:
-        pb_roles.append("ADDR [ARG2]")
-        functors.remove('ADDR')
-        current_arg += 1
-
-    # Sort the remaining functors based on their position in the hierarchy
-    sorted_functors = sorted(functors, key=lambda f: functor_hierarchy.index(f))
-    pb_roles += [f"{functor} [ARG{idx + current_arg}]" for idx, functor in enumerate(sorted_functors)]
-
-    return ", ".join(pb_roles)
+    return role_mapper.map(roles)
 
 
 if __name__ == "__main__":
 
     args = parser.parse_args()
-    definitions = store_wordnet(args.wordnet)
-    uris = store_uris_from_mapping(args.mapping)
-
-    input_files = [
-        'files_26.8.24/frames_Sallust_1-10.csv',
-        'files_26.8.24/frames_Sallust_11-20.csv',
-        'files_26.8.24/frames_Sallust_21-30.csv',
-        'files_26.8.24/frames_Sallust_31-40.csv',
-        'files_26.8.24/frames_Sallust_41-51.csv',
-        'files_26.8.24/frames_Sallust_52-61.csv'
-    ]
-
-    # Create a dictionary of dictionaries for mapping:
-    # main keys are UMR entries + each of them is a dictionary with keys v1_id, example, roles, lemma, ...
-    after_mapping = {}
-    with open('Vallex4UMR.txt', 'w') as outfile:
-        for file_path in input_files:
-            with open(file_path, mode='r') as infile:
-                csv_file = csv.DictReader(infile)
-                for lines in csv_file:
-                    if 'Par.' in lines['id']:
-                        par = lines['id'].split(' ')[-1]
-                        continue
-                    else:
-                        # Ignore entries annotated as UMR abstract predicates
-                        if lines['UMR'].endswith('-91'):
-                            continue
-                        # Consider only well-formed entries
-                        # 1. standard patterns (dico-01, dico2-01, dico-NEW-23)
-                        # 2. merged entries (polliceor-01/polliceor-02)
-                        if re.match(r"^[a-zA-Z]+(\d)?(-NEW)?-\d{2}(/[a-zA-Z]+(\d)?(-NEW)?-\d{2})*$", lines["UMR"]):
-                            create_entries(after_mapping, lines)
-
-        after_mapping = populate_other_entries(args.mapping, args.vallex, after_mapping)
-
-        # Print out Vallex4UMR, after the mapping has been resolved
-        filtered_after_mapping = remove_duplicates(after_mapping)
-        process_entries(filtered_after_mapping, outfile)
+    if args.wordnet_loading == 'indexed' and not args.cache_dir:
+        parser.error("--wordnet_loading indexed requires --cache_dir, where the WordNet index is stored.")
+    if args.functor_hierarchy:
+        role_mapper = RoleMapper(load_hierarchy(args.functor_hierarchy))
+
+    input_files = default_input_files
+    if args.inputs or args.input_manifest:
+        try:
+            input_files = expand_inputs(args.inputs or [], args.input_manifest or [])
+        except FileNotFoundError as error:
+            parser.error(str(error))
+    if args.wordnet_loading == 'indexed' and is_compressed(args.wordnet):
+        # Rows cannot be read at their offsets in a compressed file
+        print("--wordnet_loading indexed is not available for compressed WordNet files: using needed.", file=sys.stderr)
+        args.wordnet_loading = 'needed'
+
+    if args.profile:
+        profiler.start(trace_memory=not args.no_trace_memory, cprofile=args.cprofile)
+        # Functions called for each row/entry are measured cumulatively (only in this process, not in --jobs workers)
+        is_well_formed = profiler.wrap('is_well_formed', is_well_formed)
+        create_entries = profiler.wrap('create_entries', create_entries)
+        roles_to_propbank = profiler.wrap('roles_to_propbank', roles_to_propbank)
+        format_info = profiler.wrap('format_info', format_info)
+
+    # Resources are independent of each other: each is available as a future, waited for only when needed
+    pool = {'threads': ThreadPoolExecutor, 'processes': ProcessPoolExecutor}.get(args.loading)
+    with pool(max_workers=3) if pool else contextlib.nullcontext() as loader:
+        with profiler.stage('load_resources'):
+            resources = {
+                'mapping': submit(loader, timed_load, 'Mapping', build_cache.cached,
+                                  args.cache_dir, 'mapping', [args.mapping], load_mapping, args.mapping,
+                                  bool(args.profile)),
+                'vallex': submit(loader, timed_load, 'Vallex2', build_cache.cached,
+                                 args.cache_dir, 'vallex', [args.vallex], store_vallex, args.vallex),
+            }
+            if args.wordnet_loading == 'full':
+                resources['wordnet'] = submit(loader, timed_load, 'WordNet', load_wordnet,
+                                              args.wordnet, 'full', args.cache_dir)
+
+            mapping = resources['mapping'].result()
+            if args.wordnet_loading != 'full':
+                resources['wordnet'] = submit(loader, timed_load, 'WordNet', load_wordnet, args.wordnet,
+                                              args.wordnet_loading, args.cache_dir,
+                                              collect_synset_ids(input_files, mapping))
+
+        if args.validate:  # while WordNet and Vallex2 may still be loading
+            with profiler.stage('validate') as stage:
+                report = validate(input_files, args.mapping, mapping, args.jobs)
+                with open(args.validate, 'w', encoding='utf-8') as output:
+                    json.dump(report, output, indent=2, ensure_ascii=False)
+                stage['problems'] = len(report['problems'])
+            print(f"Validation: {len(report['problems'])} problems "
+                  f"({', '.join(f'{sum(c.values())} {severity}' for severity, c in report['summary'].items())}), "
+                  f"see {args.validate}.", file=sys.stderr)
+
+        # If WordNet is still loading, the annotation files are read anyway, and definitions are added afterwards.
+        definitions = resources['wordnet'].result() if resources['wordnet'].done() else None
+
+        # Create a dictionary of entries for mapping:
+        # main keys are UMR entries + each of them is an Entry with fields v1_frame, example, roles, lemma, ...
+        after_mapping = {}
+        with profiler.stage('read_annotations') as stage:
+            if args.jobs > 1 or args.cache_dir:
+                # Each file is read into its own partial table; tables are merged following the order of input_files.
+                resource_files = [args.wordnet, args.mapping]
+                if args.functor_hierarchy:
+                    resource_files.append(args.functor_hierarchy)
+                for partial in read_partial_tables(input_files, definitions, mapping, args.jobs, args.cache_dir,
+                                                   resource_files):
+                    merge_entries(after_mapping, partial, conflicts)
+            else:
+                for file_path in input_files:
+                    read_annotations(file_path, definitions, mapping, after_mapping)
+            stage['files'], stage['entries'] = len(input_files), len(after_mapping)
+
+        with profiler.stage('resolve_definitions'):  # including the time spent waiting for WordNet
+            definitions = resources['wordnet'].result()
+            resolve_definitions(after_mapping, definitions)
+        with profiler.stage('populate_other_entries') as stage:  # including the time spent waiting for Vallex2
+            after_mapping = populate_other_entries(mapping, definitions, resources['vallex'].result(), after_mapping)
+            stage['entries'] = len(after_mapping)
+
+    # Print out Vallex4UMR, after the mapping has been resolved
+    if args.sum_frames:
+        with profiler.stage('remove_duplicates') as stage:
+            filtered_after_mapping = remove_duplicates(after_mapping)
+            stage['entries'] = len(filtered_after_mapping)
+        # Add sum and habeo frames directly, without printing and re-reading Vallex4UMR.txt
+        with profiler.stage('add_sum_frames') as stage:
+            existing_entries, predicate_info, examples_index = add_sum_frames(
+                to_sum_frames_entries(filtered_after_mapping), args.sum_frames)
+            stage['entries'] = len(existing_entries)
+        with profiler.stage('write_output') as stage:
+            write_vallex4umr(existing_entries, predicate_info, examples_index, 'Vallex4UMR.txt', args.sort_buffer)
+            stage['entries'] = len(existing_entries)
+    else:
+        # Duplicates are removed while formatting (see format_info in the report), sorting and writing
+        with profiler.stage('write_output') as stage:
+            with open('Vallex4UMR.txt', 'w') as outfile:
+                process_entries(after_mapping, outfile, args.sort_buffer)
+            stage['entries'] = len(after_mapping)
+
+    if conflicts:
+        print(conflicts.format_summary(), file=sys.stderr)
+    if args.conflicts:
+        conflicts.write(args.conflicts)
+
+    if args.binary:
+        with profiler.stage('compile_binary'):
+            compile_text('Vallex4UMR.txt')
+    if args.sqlite:
+        with profiler.stage('export_sqlite'):
+            if args.sum_frames:
+                export_text('Vallex4UMR.txt', args.sqlite)
+            else:  # straight from memory, without re-reading the output
+                export_entries(to_sum_frames_entries(remove_duplicates(after_mapping)), args.sqlite)
+    if args.index or args.shard_dir:
+        with profiler.stage('index_output'):
+            if args.index:
+                write_index('Vallex4UMR.txt')
+            if args.shard_dir:
+                write_shards('Vallex4UMR.txt', args.shard_dir)
+
+    if args.profile:
+        profiler.functions['roles_to_propbank'].update(
+            {f"cache_{key}": value for key, value in role_mapper.cache_info()._asdict().items()})
+        profiler.write(args.profile)
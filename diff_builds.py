@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Structural diff between two builds of Vallex4UMR.txt: which UMR entries were added, removed or changed,
+and which fields changed (roles, Vallex1 ids, examples, LDT ids, POS, ...).
+
+Both files are read in parallel, one entry at a time, by append_sum_frames.iter_vallex4umr(). An entry is kept in
+memory only until the same UMR id is found in the other build, so that two builds in the same order (as written by
+the same script) are compared with only a few entries in memory.
+
+    python3 diff_builds.py old/Vallex4UMR.txt new/Vallex4UMR.txt --json diff.json
+"""
+
+import argparse
+import itertools
+import json
+import sys
+
+from append_sum_frames import iter_vallex4umr
+
+# Fields of the entries, with the names they have in the text file
+FIELDS = {'roles': 'roles', 'synset_id': 'synset_id', 'synset_definition': 'synset_definition',
+          'lemma_URI': 'lemma_URI', 'POS': 'POS', 'gramm_info': 'gramm_info', 'frames': 'Vallex1_id',
+          'examples': 'example', 'LDT_ids': 'LDT_ids'}
+LIST_FIELDS = {'frames', 'examples', 'LDT_ids'}
+
+
+def compare_entries(old, new):
+    """Return the changes between two versions of an entry: field -> {old, new} or {added, removed} for lists."""
+    changes = {}
+    for field, name in FIELDS.items():
+        old_value, new_value = old.get(field), new.get(field)
+        if old_value == new_value:
+            continue
+        if field in LIST_FIELDS:
+            old_items, new_items = dict.fromkeys(old_value or []), dict.fromkeys(new_value or [])
+            changes[name] = {'added': [item for item in new_items if item not in old_items],
+                             'removed': [item for item in old_items if item not in new_items]}
+            if not changes[name]['added'] and not changes[name]['removed']:
+                changes[name] = {'reordered': True}
+        else:
+            changes[name] = {'old': old_value, 'new': new_value}
+    return changes
+
+
+def diff_builds(old_file, new_file):
+    """
+    Compare two builds; returns {'added': [UMR ids], 'removed': [UMR ids], 'changed': {UMR id: changes}}.
+    Changed entries are listed in the order of the old build, added ones in the order of the new one.
+    """
+    diff = {'added': [], 'removed': [], 'changed': {}}
+    pending_old, pending_new = {}, {}  # entries not found yet in the other build
+    compared = 0
+
+    def compare(umr_id, old, new):
+        nonlocal compared
+        compared += 1
+        changes = compare_entries(old, new)
+        if changes:
+            diff['changed'][umr_id] = changes
+
+    for old_pair, new_pair in itertools.zip_longest(iter_vallex4umr(old_file), iter_vallex4umr(new_file)):
+        if old_pair is not None:
+            umr_id, old = old_pair
+            if umr_id in pending_new:
+                compare(umr_id, old, pending_new.pop(umr_id))
+            else:
+                pending_old[umr_id] = old
+        if new_pair is not None:
+            umr_id, new = new_pair
+            if umr_id in pending_old:
+                compare(umr_id, pending_old.pop(umr_id), new)
+            else:
+                pending_new[umr_id] = new
+
+    diff['removed'] = list(pending_old)
+    diff['added'] = list(pending_new)
+    diff['summary'] = {'compared': compared, 'added': len(diff['added']), 'removed': len(diff['removed']),
+                       'changed': len(diff['changed'])}
+    return diff
+
+
+def format_diff(diff):
+    """Human-readable version of the diff."""
+    lines = [f"{diff['summary']['added']} added, {diff['summary']['removed']} removed, "
+             f"{diff['summary']['changed']} changed ({diff['summary']['compared']} entries in both builds)"]
+    lines += [f"+ {umr_id}" for umr_id in diff['added']]
+    lines += [f"- {umr_id}" for umr_id in diff['removed']]
+    for umr_id, changes in diff['changed'].items():
+        lines.append(f"~ {umr_id}")
+        for name, change in changes.items():
+            if 'reordered' in change:
+                lines.append(f"\t{name}: reordered")
+                continue
+            if 'old' in change:
+                lines.append(f"\t{name}: {change['old']} -> {change['new']}")
+                continue
+            lines += [f"\t{name} +: {item}" for item in change['added']]
+            lines += [f"\t{name} -: {item}" for item in change['removed']]
+    return '\n'.join(lines) + '\n'
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old", help="Vallex4UMR text file of the previous build.")
+    parser.add_argument("new", help="Vallex4UMR text file of the new build.")
+    parser.add_argument("--json", help="Also write the diff as JSON to this path.")
+    parser.add_argument("--output", help="Write the human-readable diff to this path instead of stdout.")
+    args = parser.parse_args()
+
+    differences = diff_builds(args.old, args.new)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as output:
+            json.dump(differences, output, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(format_diff(differences))
+    else:
+        sys.stdout.write(format_diff(differences))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+import sys
+
+
+class Entry:
+    """
+    A single Vallex4UMR entry.
+    Slots are used instead of one dict per entry, since the lexicon holds tens of thousands of entries,
+    most of them with the same fields. Repeated strings (roles, lemma URIs, POS, ...) are interned.
+    LDT_id, v1_frame and example are only filled in for entries observed in the annotated texts.
+    """
+    __slots__ = ('lemma', 'synset_id', 'URI_lemma', 'definition', 'POS', 'roles', 'gramm_info',
+                 'LDT_id', 'v1_frame', 'example')
+
+    def __init__(self, lemma, synset_id, URI_lemma, definition, POS, roles, gramm_info=None,
+                 LDT_id=None, v1_frame=None, example=None):
+        self.lemma = sys.intern(lemma)
+        self.synset_id = sys.intern(synset_id)
+        self.URI_lemma = sys.intern(URI_lemma)
+        self.definition = definition
+        self.POS = sys.intern(POS)
+        self.roles = sys.intern(roles)
+        self.gramm_info = gramm_info
+        self.LDT_id = LDT_id  # list
+        # Dicts (with no values) keep insertion order, so that the output does not depend on string hashing.
+        self.v1_frame = v1_frame
+        self.example = example
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def __repr__(self):
+        return f"Entry({', '.join(f'{slot}={getattr(self, slot)!r}' for slot in self.__slots__)})"
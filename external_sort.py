@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Sorting of the output records (sort key, formatted entry) with bounded memory.
+Up to max_in_memory records are sorted in memory; beyond that, sorted runs are written to temporary files
+and merged, so that only one record per run is held in memory while writing. At most MAX_FAN_IN runs are merged
+at once (every MAX_FAN_IN runs of a level are merged into a run of the next level), so that the number of open
+temporary files stays well below the limit of the system.
+"""
+
+import heapq
+import itertools
+import operator
+import pickle
+import tempfile
+
+MAX_FAN_IN = 64
+
+
+def read_run(run):
+    """Yield the records pickled into a run file, in order."""
+    run.seek(0)
+    while True:
+        try:
+            yield pickle.load(run)
+        except EOFError:
+            return
+
+
+def write_run(records, tmp_dir=None, presorted=False):
+    """Sort the records (unless presorted) and write them to a temporary file, removed when closed."""
+    run = tempfile.TemporaryFile(dir=tmp_dir)
+    pickler = pickle.Pickler(run, protocol=pickle.HIGHEST_PROTOCOL)
+    for record in records if presorted else sorted(records, key=operator.itemgetter(0)):
+        pickler.dump(record)
+        pickler.clear_memo()
+    return run
+
+
+def merge_runs(runs, tmp_dir=None):
+    """Merge sorted runs (in the order of their records) into a single run; the merged runs are closed."""
+    try:
+        return write_run(heapq.merge(*(read_run(run) for run in runs), key=operator.itemgetter(0)), tmp_dir,
+                         presorted=True)
+    finally:
+        for run in runs:
+            run.close()
+
+
+def add_run(levels, run, tmp_dir=None):
+    """Add a run to levels[0]; every MAX_FAN_IN runs of a level are merged into one run of the next level."""
+    for level in itertools.count():
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(run)
+        if len(levels[level]) < MAX_FAN_IN:
+            return
+        run = merge_runs(levels[level], tmp_dir)
+        levels[level] = []
+
+
+def sort_records(records, max_in_memory=None, tmp_dir=None):
+    """
+    Yield the (key, value) records sorted by key (records with the same key keep their order).
+    If max_in_memory is given and there are more records, they are sorted with an external merge sort.
+    """
+    levels = []  # runs of higher levels hold earlier records
+    buffer = []
+    try:
+        for record in records:
+            buffer.append(record)
+            if max_in_memory and len(buffer) >= max_in_memory:
+                add_run(levels, write_run(buffer, tmp_dir), tmp_dir)
+                buffer = []
+        if not levels:
+            yield from sorted(buffer, key=operator.itemgetter(0))
+            return
+        if buffer:
+            add_run(levels, write_run(buffer, tmp_dir), tmp_dir)
+            buffer = []
+        runs = [run for level in reversed(levels) for run in level]
+        levels = [runs]
+        while len(runs) > MAX_FAN_IN:
+            runs = [merge_runs(runs[start:start + MAX_FAN_IN], tmp_dir) for start in range(0, len(runs), MAX_FAN_IN)]
+            levels = [runs]
+        yield from heapq.merge(*(read_run(run) for run in runs), key=operator.itemgetter(0))
+    finally:
+        for level in levels:
+            for run in level:
+                run.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Conversion of ACT/PAT/... functors to ARG0/ARG1/... PropBank roles.
+The hierarchy of the functors is turned into a rank table once, and the roles of each combination of functors
+(there are only a few hundred of them) are computed once and then cached.
+"""
+
+import functools
+
+# Custom hierarchy, cf. default mapping available at
+# https://github.com/ufal/UMR/blob/main/tecto2umr/dafault-functors-to-umrlabels.txt
+DEFAULT_HIERARCHY = [
+    'ACT', 'PAT', 'ADDR', 'EFF', 'ORIG', 'BEN', 'DIFF', 'REG', 'MANN', 'DIR1', 'DIR3', 'DIR2', 'LOC',
+    'TOWH', 'TFHL', 'TWHEN', 'MEANS', 'EXT', 'AIM', 'MAT', 'INTT', 'CAUS', 'CPR', 'APP', 'ACMP'
+]
+
+
+def load_hierarchy(filename):
+    """
+    Read a functor hierarchy from a file in the style of tecto2umr's default-functors-to-umrlabels.txt:
+    one functor per line, in the first column (other columns, empty lines and lines starting with # are ignored).
+    """
+    hierarchy = []
+    with open(filename, 'r', encoding='utf-8') as lines:
+        for line in lines:
+            columns = line.split()
+            if columns and not columns[0].startswith('#') and columns[0] not in hierarchy:
+                hierarchy.append(columns[0])
+    return hierarchy
+
+
+class RoleMapper:
+    """
+    Maps lists of functors to PropBank roles, e.g. ['PAT', 'ACT', 'LOC'] to 'ACT [ARG0], PAT [ARG1], LOC [ARG2]'.
+    Only ACT, PAT and ADDR are fixed (ARG0, ARG1 and ARG2, respectively); the other arguments and adjuncts follow,
+    in the order of the hierarchy. The results are cached (up to maxsize combinations of functors).
+    """
+
+    def __init__(self, hierarchy=None, maxsize=4096):
+        self.hierarchy = list(hierarchy or DEFAULT_HIERARCHY)
+        self.ranks = {}
+        for rank, functor in enumerate(self.hierarchy):
+            self.ranks.setdefault(functor, rank)
+        self._cached_roles = functools.lru_cache(maxsize=maxsize)(self._roles)
+
+    def map(self, roles):
+        """Return the PropBank roles of a list of functors; '---' and empty functors are skipped."""
+        # The roles only depend on which functors occur, and how many times, so the sorted tuple is the cache key
+        return self._cached_roles(tuple(sorted(f for f in roles if f.strip() not in ('---', ''))))
+
+    def cache_info(self):
+        """Hits, misses, maxsize and current size of the cache."""
+        return self._cached_roles.cache_info()
+
+    def _roles(self, functors):
+        functors = list(functors)
+        pb_roles = []
+
+        current_arg = 1  # ARG0 will be only for ACT anyway
+
+        # Always assign ACT to ARG0, PAT to ARG1, and ADDR to ARG2 (?) if they are present
+        if 'ACT' in functors:
+            pb_roles.append("ACT [ARG0]")
+            functors.remove('ACT')
+        if 'PAT' in functors:
+            pb_roles.append("PAT [ARG1]")
+            functors.remove('PAT')
+            current_arg += 1
+        if 'ADDR' in functors:
+            pb_roles.append("ADDR [ARG2]")
+            functors.remove('ADDR')
+            current_arg += 1
+
+        # Sort the remaining functors based on their rank in the hierarchy
+        for functor in functors:
+            if functor not in self.ranks:
+                raise ValueError(f"{functor!r} is not in the functor hierarchy")
+        sorted_functors = sorted(functors, key=self.ranks.__getitem__)
+        pb_roles += [f"{functor} [ARG{idx + current_arg}]" for idx, functor in enumerate(sorted_functors)]
+
+        return ", ".join(pb_roles)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Input files of the build: lists given by glob patterns or manifests, and transparent reading of compressed files.
+
+Files ending in .gz, .xz or .zst (.zstd) are decompressed while they are read, on a background thread,
+so that decompression overlaps with the parsing of the CSV rows; nothing is written to disk.
+zstd requires Python 3.14 (compression.zstd) or the zstandard package.
+"""
+
+import glob
+import io
+import lzma
+import os
+import queue
+import threading
+import zlib
+
+try:
+    from compression import zstd
+except ImportError:  # Python < 3.14
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+CHUNK_SIZE = 1 << 20
+QUEUED_CHUNKS = 8  # decompressed chunks waiting to be parsed, at most
+
+
+def expand_inputs(patterns=(), manifests=()):
+    """
+    Return the input files matching the glob patterns (sorted by name, for each pattern), followed by those listed in
+    the manifests: one path or glob pattern per line, relative to the manifest (empty lines and # comments are ignored).
+    Raises FileNotFoundError if a pattern matches no file.
+    """
+    patterns = list(patterns)
+    for manifest in manifests:
+        directory = os.path.dirname(manifest)
+        with open(manifest, mode='r', encoding='utf-8') as lines:
+            patterns.extend(os.path.join(directory, line.strip()) for line in lines
+                            if line.strip() and not line.lstrip().startswith('#'))
+    files = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+        else:
+            matches = [pattern] if os.path.exists(pattern) else []
+        if not matches:
+            raise FileNotFoundError(f"No input file matches {pattern}")
+        files.extend(matches)
+    return files
+
+
+def is_compressed(filename):
+    return filename.endswith(('.gz', '.xz', '.zst', '.zstd'))
+
+
+def new_decompressor(filename):
+    """Return a function creating a decompressor (with decompress(), eof and unused_data) for the file."""
+    if filename.endswith('.gz'):
+        return lambda: zlib.decompressobj(zlib.MAX_WBITS | 16)
+    if filename.endswith('.xz'):
+        return lzma.LZMADecompressor
+    if zstd is None:
+        raise ImportError(f"Reading {filename} requires Python 3.14 or the zstandard package.")
+    if hasattr(zstd.ZstdDecompressor, 'decompressobj'):  # zstandard
+        return lambda: zstd.ZstdDecompressor().decompressobj()
+    return zstd.ZstdDecompressor
+
+
+def decompressed_chunks(filename):
+    """
+    Yield the decompressed content of the file, in chunks. Large compressed chunks are passed to the decompressor,
+    which then runs without holding the GIL. Files made of several compressed streams (e.g. concatenated) are supported,
+    as well as zero padding after a gzip member (as gzip.open() accepts). Raises EOFError if the file is truncated.
+    """
+    new = new_decompressor(filename)
+    padded = filename.endswith('.gz')
+    with open(filename, 'rb') as compressed:
+        decompressor = new()
+        started = between_streams = False
+        for data in iter(lambda: compressed.read(CHUNK_SIZE), b''):
+            if padded and between_streams:
+                data = data.lstrip(b'\0')
+            while data:
+                started = True
+                between_streams = False
+                chunk = decompressor.decompress(data)
+                if chunk:
+                    yield chunk
+                data = b''
+                if getattr(decompressor, 'eof', False):  # end of a stream: the next one may follow
+                    data = decompressor.unused_data.lstrip(b'\0') if padded else decompressor.unused_data
+                    decompressor = new()
+                    started = False
+                    between_streams = True
+        if started and not getattr(decompressor, 'eof', True):
+            raise EOFError(f"{filename} ended before the end of its compressed data (truncated file?)")
+
+
+class BackgroundReader(io.RawIOBase):
+    """Binary stream of chunks produced (e.g. decompressed) ahead by a background thread."""
+
+    def __init__(self, chunks):
+        super().__init__()
+        self.source = chunks
+        self.chunks = queue.Queue(maxsize=QUEUED_CHUNKS)
+        self.pending = memoryview(b'')
+        self.finished = False
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self.thread.start()
+
+    def _read_ahead(self):
+        try:
+            for chunk in self.source:
+                if self.stopping.is_set():
+                    break
+                self._put(chunk)
+            self._put(b'')
+        except BaseException as error:  # raised again by readinto()
+            self._put(error)
+        finally:
+            self.source.close()
+
+    def _put(self, item):
+        while not self.stopping.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending and not self.finished:
+            chunk = self.chunks.get()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            self.pending = memoryview(chunk)
+            self.finished = not chunk
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopping.set()
+            self.thread.join()
+        super().close()
+
+
+def open_input(filename, mode='r', encoding=None):
+    """
+    Open an input file for reading, like open(filename, mode): in text mode ('r') or binary mode ('rb').
+    Compressed files are decompressed on the fly by a background thread.
+    """
+    if not is_compressed(filename):
+        return open(filename, mode=mode, encoding=encoding)
+    binary = io.BufferedReader(BackgroundReader(decompressed_chunks(filename)), buffer_size=CHUNK_SIZE)
+    return binary if 'b' in mode else io.TextIOWrapper(binary, encoding=encoding)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Compiled binary form of Vallex4UMR, to look up single entries without reading the whole text file.
+
+The file is memory-mapped and not parsed when opened. It consists of:
+- a header, with the number of entries and the offsets of the other sections;
+- one fixed-width record per entry, sorted by UMR id, made of references (offset, length) to the string pool
+  for the scalar fields, and of (start, count) slices of the list table for the list fields;
+- the lemma index: record numbers sorted by lemma;
+- the list table: string references for the items of the list fields (Vallex1 ids, examples, LDT ids);
+- the string pool, with each distinct string stored once in UTF-8.
+Lookups by UMR id and by lemma are binary searches.
+
+Entries are dicts with the same keys as those built by append_sum_frames.read_vallex4umr().
+
+    python3 lexicon.py Vallex4UMR.txt                     # writes Vallex4UMR.bin
+    python3 lexicon.py Vallex4UMR.bin --get dico-01
+    python3 lexicon.py Vallex4UMR.bin --lemma dico
+"""
+
+import argparse
+import mmap
+import os
+import struct
+
+from append_sum_frames import read_vallex4umr
+
+MAGIC = b'V4UMRLX1'
+HEADER = struct.Struct('<8sIIQQQQ')  # magic, version, entries, records/lemma index/list table/string pool offsets
+VERSION = 1
+
+SCALAR_FIELDS = ['id', 'lemma', 'roles', 'synset_id', 'synset_definition', 'lemma_URI', 'POS', 'gramm_info']
+LIST_FIELDS = ['frames', 'examples', 'LDT_ids']
+RECORD = struct.Struct('<' + 'II' * (len(SCALAR_FIELDS) + len(LIST_FIELDS)))
+REFERENCE = struct.Struct('<II')
+INDEX_ITEM = struct.Struct('<I')
+MISSING = 0xFFFFFFFF  # offset (or list start) of fields the entry does not have
+
+
+def lemma_key(umr_id):
+    """Lemma an entry is found by: the part of the UMR id before the first '-', lowercased (as in the * headers)."""
+    return umr_id.split('-')[0].lower()
+
+
+def compile_lexicon(entries, filename):
+    """Write the entries (UMR id -> dict, as returned by read_vallex4umr()) to filename in the binary format."""
+    pool = bytearray()
+    pooled = {}
+
+    def reference(string):
+        if string is None:
+            return MISSING, 0
+        if string not in pooled:
+            encoded = string.encode('utf-8')
+            pooled[string] = (len(pool), len(encoded))
+            pool.extend(encoded)
+        return pooled[string]
+
+    ids = sorted(entries, key=lambda umr_id: umr_id.encode('utf-8'))  # byte order, as compared when searching
+    records = bytearray()
+    list_table = bytearray()
+    list_items = 0
+    for umr_id in ids:
+        entry = {'id': umr_id, **entries[umr_id]}
+        values = []
+        for field in SCALAR_FIELDS:
+            values.extend(reference(entry.get(field)))
+        for field in LIST_FIELDS:
+            items = entry.get(field)
+            if items is None:
+                values.extend((MISSING, 0))
+                continue
+            values.extend((list_items, len(items)))
+            for item in items:
+                list_table.extend(REFERENCE.pack(*reference(item)))
+            list_items += len(items)
+        records.extend(RECORD.pack(*values))
+
+    lemma_index = bytearray()
+    for number in sorted(range(len(ids)), key=lambda number: (lemma_key(ids[number]).encode('utf-8'), number)):
+        lemma_index.extend(INDEX_ITEM.pack(number))
+
+    records_offset = HEADER.size
+    lemma_offset = records_offset + len(records)
+    lists_offset = lemma_offset + len(lemma_index)
+    pool_offset = lists_offset + len(list_table)
+    with open(filename, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, VERSION, len(ids), records_offset, lemma_offset, lists_offset, pool_offset))
+        for section in (records, lemma_index, list_table, pool):
+            output.write(section)
+
+
+def compile_text(text_file, binary_file=None):
+    """Compile a Vallex4UMR text file (written by converter.py or append_sum_frames.py); returns the binary path."""
+    binary_file = binary_file or os.path.splitext(text_file)[0] + '.bin'
+    compile_lexicon(read_vallex4umr(text_file), binary_file)
+    return binary_file
+
+
+class Lexicon:
+    """
+    Read-only access to a compiled lexicon:
+        with Lexicon('Vallex4UMR.bin') as lexicon:
+            lexicon.get('dico-01'), lexicon.by_lemma('dico'), [umr_id for umr_id, entry in lexicon]
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as binary:
+            self.data = mmap.mmap(binary.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.records, self.lemma_index, self.lists, self.pool = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filename} is not a compiled Vallex4UMR lexicon (version {VERSION}).")
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        """Iterate over (UMR id, entry) pairs, sorted by UMR id."""
+        for number in range(self.size):
+            entry = self._entry(number)
+            yield entry.pop('id'), entry
+
+    def __contains__(self, umr_id):
+        return self._find(umr_id) is not None
+
+    def get(self, umr_id, default=None):
+        """Return the entry with the given UMR id, or default if there is none."""
+        number = self._find(umr_id)
+        if number is None:
+            return default
+        entry = self._entry(number)
+        del entry['id']
+        return entry
+
+    def by_lemma(self, lemma):
+        """Return the (UMR id, entry) pairs of a lemma (e.g. 'dico' or 'DICO'), sorted by UMR id."""
+        key = lemma.lower().encode('utf-8')
+        low, high = 0, self.size
+        while low < high:  # first position whose lemma is not lower than key
+            middle = (low + high) // 2
+            if self._lemma_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.size and self._lemma_at(low) == key:
+            entry = self._entry(INDEX_ITEM.unpack_from(self.data, self.lemma_index + low * INDEX_ITEM.size)[0])
+            found.append((entry.pop('id'), entry))
+            low += 1
+        return found
+
+    def _string(self, offset, length):
+        if offset == MISSING:
+            return None
+        start = self.pool + offset
+        return self.data[start:start + length].decode('utf-8')
+
+    def _id_bytes(self, number):
+        offset, length = REFERENCE.unpack_from(self.data, self.records + number * RECORD.size)
+        return self.data[self.pool + offset:self.pool + offset + length]
+
+    def _lemma_at(self, position):
+        number = INDEX_ITEM.unpack_from(self.data, self.lemma_index + position * INDEX_ITEM.size)[0]
+        return lemma_key(self._id_bytes(number).decode('utf-8')).encode('utf-8')
+
+    def _find(self, umr_id):
+        key = umr_id.encode('utf-8')
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            current = self._id_bytes(middle)
+            if current == key:
+                return middle
+            if current < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _entry(self, number):
+        values = RECORD.unpack_from(self.data, self.records + number * RECORD.size)
+        entry = {}
+        for position, field in enumerate(SCALAR_FIELDS):
+            value = self._string(values[2 * position], values[2 * position + 1])
+            if value is not None or field == 'lemma':  # lemma is always set by read_vallex4umr(), even if None
+                entry[field] = value
+        for position, field in enumerate(LIST_FIELDS, start=len(SCALAR_FIELDS)):
+            start, count = values[2 * position], values[2 * position + 1]
+            if start != MISSING:
+                entry[field] = [self._string(*REFERENCE.unpack_from(self.data, self.lists + item * REFERENCE.size))
+                                for item in range(start, start + count)]
+        return entry
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("lexicon", help="Vallex4UMR text file to compile, or compiled file to query.")
+    parser.add_argument("--output", help="Path of the compiled file (default: the text file with .bin extension).")
+    parser.add_argument("--get", help="Print the entry with this UMR id.")
+    parser.add_argument("--lemma", help="Print the entries of this lemma.")
+    args = parser.parse_args()
+
+    if args.get is None and args.lemma is None:
+        print(compile_text(args.lexicon, args.output))
+    else:
+        with Lexicon(args.lexicon) as lexicon:
+            found = [(args.get, lexicon.get(args.get))] if args.get is not None else lexicon.by_lemma(args.lemma)
+            for umr_id, entry in found:
+                print(umr_id, entry)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Stage-level profiling of the Vallex4UMR build (option --profile of converter.py and append_sum_frames.py).
+For each stage, wall time, CPU time, peak memory (traced by tracemalloc) and peak RSS are recorded,
+together with counts (rows, entries, ...) set by the stage itself. The report is written as JSON.
+"""
+
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss():
+    """Peak resident set size of the process so far, in MiB (None if it cannot be measured)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10  # bytes on macOS, KiB on Linux
+
+
+class Profiler:
+    """Collects the metrics of the stages of a run. Does nothing until start() is called."""
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.functions = {}
+        self.cprofile = None
+        self.started = None
+
+    def start(self, trace_memory=True, cprofile=False):
+        self.enabled = True
+        self.started = (time.perf_counter(), time.process_time())
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Measure the code run in the with block. The yielded dict can be filled with counts (e.g. rows, entries).
+        A stage run several times (e.g. once per file) is accumulated.
+        """
+        counts = {}
+        if not self.enabled:
+            yield counts
+            return
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        rss_before = peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield counts
+        finally:
+            metrics = self.stages.setdefault(name, {'runs': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            metrics['runs'] += 1
+            metrics['wall_s'] += time.perf_counter() - wall
+            metrics['cpu_s'] += time.process_time() - cpu
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                metrics['traced_peak_mib'] = max(metrics.get('traced_peak_mib', 0.0), (peak - memory_before) / 2**20)
+                metrics['traced_delta_mib'] = metrics.get('traced_delta_mib', 0.0) + (current - memory_before) / 2**20
+            if rss_before is not None:
+                metrics['peak_rss_mib'] = peak_rss()
+                metrics['peak_rss_growth_mib'] = metrics.get('peak_rss_growth_mib', 0.0) + peak_rss() - rss_before
+            for key, value in counts.items():
+                metrics[key] = metrics.get(key, 0) + value
+
+    def wrap(self, name, function):
+        """Return function, measuring the number of calls and their cumulative wall and CPU time."""
+        metrics = self.functions.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics['calls'] += 1
+                metrics['wall_s'] += time.perf_counter() - wall
+                metrics['cpu_s'] += time.process_time() - cpu
+        return wrapper
+
+    def report(self, top=30):
+        report = {
+            'argv': sys.argv,
+            'total': {'wall_s': time.perf_counter() - self.started[0], 'cpu_s': time.process_time() - self.started[1],
+                      'peak_rss_mib': peak_rss()},
+            'stages': self.stages,
+            'functions': self.functions,
+        }
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            stats = pstats.Stats(self.cprofile)
+            hottest = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+            report['cprofile'] = [
+                {'function': f"{filename}:{line}({function})", 'calls': calls, 'tottime_s': tottime, 'cumtime_s': cumtime}
+                for (filename, line, function), (_, calls, tottime, cumtime, _) in hottest]
+        return report
+
+    def write(self, filename):
+        """Write the JSON report, plus the full cProfile statistics (for pstats/snakeviz) next to it if enabled."""
+        with open(filename, 'w', encoding='utf-8') as output:
+            json.dump(self.report(), output, indent=2)
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(os.path.splitext(filename)[0] + '.prof')
+
+
+profiler = Profiler()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Export of Vallex4UMR to a SQLite database, to be queried by UMR id, lemma, lemma URI or synset id.
+
+Tables:
+- entries: one row per UMR id, with its lemma (as in lexicon.lemma_key()), roles, synset id, lemma URI, POS,
+  grammatical information and the id of its definition;
+- definitions: the distinct synset definitions;
+- roles: the functors and PropBank roles of each entry, in order (e.g. ACT, ARG0);
+- frames, examples, ldt_ids: the Vallex1 ids, examples and LDT ids of each entry, in order.
+
+    python3 sqlite_export.py Vallex4UMR.txt Vallex4UMR.sqlite
+    python3 sqlite_export.py Vallex4UMR.sqlite --lemma dico
+"""
+
+import argparse
+import contextlib
+import os
+import re
+import sqlite3
+
+from append_sum_frames import read_vallex4umr
+from lexicon import lemma_key
+
+SCHEMA = """
+CREATE TABLE definitions (id INTEGER PRIMARY KEY, definition TEXT NOT NULL UNIQUE);
+CREATE TABLE entries (
+    id INTEGER PRIMARY KEY,
+    umr_id TEXT NOT NULL UNIQUE,
+    lemma TEXT NOT NULL,
+    header TEXT,
+    roles TEXT,
+    synset_id TEXT,
+    definition_id INTEGER REFERENCES definitions (id),
+    lemma_uri TEXT,
+    pos TEXT,
+    gramm_info TEXT
+);
+CREATE TABLE roles (
+    entry_id INTEGER NOT NULL REFERENCES entries (id), position INTEGER NOT NULL, functor TEXT NOT NULL,
+    role TEXT NOT NULL, PRIMARY KEY (entry_id, position)
+) WITHOUT ROWID;
+CREATE TABLE frames (
+    entry_id INTEGER NOT NULL REFERENCES entries (id), position INTEGER NOT NULL, vallex1_id TEXT NOT NULL,
+    PRIMARY KEY (entry_id, position)
+) WITHOUT ROWID;
+CREATE TABLE examples (
+    entry_id INTEGER NOT NULL REFERENCES entries (id), position INTEGER NOT NULL, example TEXT NOT NULL,
+    PRIMARY KEY (entry_id, position)
+) WITHOUT ROWID;
+CREATE TABLE ldt_ids (
+    entry_id INTEGER NOT NULL REFERENCES entries (id), position INTEGER NOT NULL, ldt_id TEXT NOT NULL,
+    PRIMARY KEY (entry_id, position)
+) WITHOUT ROWID;
+CREATE INDEX entries_lemma ON entries (lemma);
+CREATE INDEX entries_lemma_uri ON entries (lemma_uri);
+CREATE INDEX entries_synset_id ON entries (synset_id);
+"""
+
+LIST_TABLES = {'frames': ('frames', 'vallex1_id'), 'examples': ('examples', 'example'),
+               'LDT_ids': ('ldt_ids', 'ldt_id')}  # entry field -> table, column
+functor_role = re.compile(r"([^\s,;\[\]]+) \[([^\]]+)\]")  # e.g. ACT [ARG0]
+
+
+def export_entries(entries, database):
+    """
+    Write the entries (UMR id -> dict, as returned by append_sum_frames.read_vallex4umr()) to a new SQLite database,
+    replacing it if it exists. All rows are inserted in a single transaction.
+    """
+    if os.path.exists(database):
+        os.remove(database)
+    connection = sqlite3.connect(database)
+    try:
+        connection.executescript(SCHEMA)
+        definitions = {}
+        rows = {'entries': [], 'roles': [], 'frames': [], 'examples': [], 'ldt_ids': []}
+        for entry_id, (umr_id, entry) in enumerate(entries.items(), start=1):
+            definition = entry.get('synset_definition')
+            if definition is not None and definition not in definitions:
+                definitions[definition] = len(definitions) + 1
+            rows['entries'].append((
+                entry_id, umr_id, lemma_key(umr_id), entry.get('lemma'), entry.get('roles'), entry.get('synset_id'),
+                definitions.get(definition), entry.get('lemma_URI'), entry.get('POS'), entry.get('gramm_info')))
+            rows['roles'].extend((entry_id, position, functor, role) for position, (functor, role)
+                                 in enumerate(functor_role.findall(entry.get('roles') or '')))
+            for field, (table, _) in LIST_TABLES.items():
+                if entry.get(field) is not None:
+                    rows[table].extend((entry_id, position, item) for position, item in enumerate(entry[field]))
+
+        with connection:  # one transaction
+            connection.executemany("INSERT INTO definitions VALUES (?, ?)",
+                                   ((number, definition) for definition, number in definitions.items()))
+            connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows['entries'])
+            connection.executemany("INSERT INTO roles VALUES (?, ?, ?, ?)", rows['roles'])
+            for table, _ in LIST_TABLES.values():
+                connection.executemany(f"INSERT INTO {table} VALUES (?, ?, ?)", rows[table])
+    finally:
+        connection.close()
+
+
+def export_text(text_file, database):
+    """Export a Vallex4UMR text file (written by converter.py or append_sum_frames.py) to a SQLite database."""
+    export_entries(read_vallex4umr(text_file), database)
+
+
+def query(connection, umr_id=None, lemma=None, lemma_uri=None, synset_id=None):
+    """
+    Return the entries matching all the given conditions, as dicts like those of read_vallex4umr() (UMR id -> entry).
+    The lemma is matched as in the lexicon.Lexicon.by_lemma(), e.g. 'dico' or 'DICO'.
+    """
+    conditions = {'umr_id': umr_id, 'lemma': lemma.lower() if lemma is not None else None,
+                  'lemma_uri': lemma_uri, 'synset_id': synset_id}
+    where = ' AND '.join(f"e.{column} = ?" for column, value in conditions.items() if value is not None) or '1'
+    parameters = [value for value in conditions.values() if value is not None]
+    cursor = connection.execute(
+        "SELECT e.umr_id, e.header, e.roles, e.synset_id, d.definition, e.lemma_uri, e.pos, e.gramm_info "
+        f"FROM entries e LEFT JOIN definitions d ON d.id = e.definition_id WHERE {where} ORDER BY e.id", parameters)
+    found = {}
+    for found_id, header, *values in cursor:
+        fields = zip(['roles', 'synset_id', 'synset_definition', 'lemma_URI', 'POS', 'gramm_info'], values)
+        found[found_id] = {'lemma': header, **{field: value for field, value in fields if value is not None}}
+    for field, (table, column) in LIST_TABLES.items():
+        items = connection.execute(
+            f"SELECT e.umr_id, l.{column} FROM {table} l JOIN entries e ON e.id = l.entry_id "
+            f"WHERE {where} ORDER BY l.entry_id, l.position", parameters)
+        for found_id, item in items:
+            found[found_id].setdefault(field, []).append(item)
+    return found
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", help="Vallex4UMR text file to export, or database to query.")
+    parser.add_argument("database", nargs='?', help="Path of the database to write (default: .sqlite extension).")
+    parser.add_argument("--get", help="Print the entry with this UMR id.")
+    parser.add_argument("--lemma", help="Print the entries of this lemma.")
+    parser.add_argument("--synset", help="Print the entries with this synset id.")
+    args = parser.parse_args()
+
+    if args.get is None and args.lemma is None and args.synset is None:
+        database = args.database or os.path.splitext(args.source)[0] + '.sqlite'
+        export_text(args.source, database)
+        print(database)
+    else:
+        with contextlib.closing(sqlite3.connect(args.source)) as connection:
+            for umr_id, entry in query(connection, args.get, args.lemma, synset_id=args.synset).items():
+                print(umr_id, entry)
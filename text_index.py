@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# Copyright © 2024 Federica Gamba <gamba@ufal.mff.cuni.cz>
+
+"""
+Random access into the Vallex4UMR text file, whose format is left unchanged.
+
+The sidecar index (Vallex4UMR.txt.idx) has one tab-separated line per ': id:' block and per '* LEMMA' header:
+    id      dico-01     <byte offset>   <length>
+    lemma   DICO        <byte offset>   <length>
+The block of an id goes from its ': id:' line to the next entry; the range of a lemma covers all the consecutive
+entries under its headers (a lemma whose entries are not consecutive has several lines).
+
+The lexicon can also be split into shards by lemma initial (a.txt, b.txt, ..., _.txt for the other initials),
+each with its own sidecar index, listed in manifest.json. To read one entry, only its shard is opened.
+
+    python3 text_index.py Vallex4UMR.txt                        # writes Vallex4UMR.txt.idx
+    python3 text_index.py Vallex4UMR.txt --shard_dir shards     # writes shards/manifest.json and the shards
+    python3 text_index.py Vallex4UMR.txt --get dico-01
+    python3 text_index.py shards/manifest.json --get dico-01
+"""
+
+import argparse
+import json
+import os
+
+INDEX_SUFFIX = '.idx'
+MANIFEST = 'manifest.json'
+
+
+def scan_text(filename):
+    """
+    Return the blocks of the entries of a Vallex4UMR text file, in file order, as (UMR id, header, start, id_start, end)
+    byte positions: header is the '* LEMMA' right before the entry (None if there is none), start is where the entry
+    begins (its header, if any), id_start is where its ': id:' line begins.
+    """
+    blocks = []
+    header, header_start = None, None
+    offset = 0
+    with open(filename, 'rb') as vallex:
+        for line in vallex:
+            stripped = line.strip()
+            if stripped.startswith(b'* '):
+                if blocks and blocks[-1][4] is None:
+                    blocks[-1][4] = offset
+                header, header_start = stripped[2:].decode('utf-8'), offset
+            elif stripped.startswith(b': id:'):
+                if blocks and blocks[-1][4] is None:
+                    blocks[-1][4] = offset
+                umr_id = stripped[len(b': id:'):].strip().decode('utf-8')
+                if header_start is None:
+                    header = None
+                blocks.append([umr_id, header, offset if header_start is None else header_start, offset, None])
+                header_start = None
+            offset += len(line)
+    if blocks and blocks[-1][4] is None:
+        blocks[-1][4] = offset
+    return [tuple(block) for block in blocks]
+
+
+def build_index(blocks):
+    """Compute the (kind, key, offset, length) lines of the sidecar index from the blocks returned by scan_text()."""
+    index = []
+    lemma_range = None  # [lemma, start, end] of the current run of entries with the same header
+    for umr_id, header, start, id_start, end in blocks:
+        index.append(('id', umr_id, id_start, end - id_start))
+        if header is not None and lemma_range is not None and header == lemma_range[0] and start == lemma_range[2]:
+            lemma_range[2] = end
+            continue
+        if lemma_range is not None:
+            index.append(('lemma', lemma_range[0], lemma_range[1], lemma_range[2] - lemma_range[1]))
+        lemma_range = [header, start, end] if header is not None else None
+    if lemma_range is not None:
+        index.append(('lemma', lemma_range[0], lemma_range[1], lemma_range[2] - lemma_range[1]))
+    return index
+
+
+def write_index(text_file, index_file=None):
+    """Write the sidecar index of a Vallex4UMR text file; returns its path."""
+    index_file = index_file or text_file + INDEX_SUFFIX
+    with open(index_file, 'w', encoding='utf-8') as output:
+        for kind, key, offset, length in build_index(scan_text(text_file)):
+            output.write(f"{kind}\t{key}\t{offset}\t{length}\n")
+    return index_file
+
+
+def load_index(index_file):
+    """Read a sidecar index: returns {'id': {UMR id: (offset, length)}, 'lemma': {LEMMA: [(offset, length), ...]}}."""
+    index = {'id': {}, 'lemma': {}}
+    with open(index_file, 'r', encoding='utf-8') as lines:
+        for line in lines:
+            kind, key, offset, length = line.rstrip('\n').split('\t')
+            if kind == 'id':
+                index['id'][key] = (int(offset), int(length))
+            else:
+                index['lemma'].setdefault(key, []).append((int(offset), int(length)))
+    return index
+
+
+def read_block(text_file, offset, length):
+    """Read the text at the given byte offset, e.g. the block of an entry."""
+    with open(text_file, 'rb') as vallex:
+        vallex.seek(offset)
+        return vallex.read(length).decode('utf-8')
+
+
+def shard_name(umr_id):
+    """Shard of an entry: the initial of its lemma, or '_' if it is not an ASCII letter."""
+    initial = umr_id[:1].lower()
+    return initial if 'a' <= initial <= 'z' else '_'
+
+
+def write_shards(text_file, directory):
+    """
+    Split a Vallex4UMR text file into shards by lemma initial, keeping the order of the entries,
+    and write the index of each shard and the manifest; returns the path of the manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    shards = {}
+    with open(text_file, 'rb') as vallex:
+        for umr_id, _, start, _, end in scan_text(text_file):
+            name = shard_name(umr_id)
+            if name not in shards:
+                shards[name] = {'file': f"{name}.txt", 'entries': 0,
+                                'output': open(os.path.join(directory, f"{name}.txt"), 'wb')}
+            vallex.seek(start)
+            shards[name]['output'].write(vallex.read(end - start))
+            shards[name]['entries'] += 1
+
+    manifest = {'source': os.path.basename(text_file), 'shards': {}}
+    for name, shard in sorted(shards.items()):
+        shard.pop('output').close()
+        shard['index'] = os.path.basename(write_index(os.path.join(directory, shard['file'])))
+        manifest['shards'][name] = shard
+    manifest_file = os.path.join(directory, MANIFEST)
+    with open(manifest_file, 'w', encoding='utf-8') as output:
+        json.dump(manifest, output, indent=2)
+    return manifest_file
+
+
+def lookup(path, umr_id):
+    """
+    Return the text block of an entry, or None if there is none.
+    path is either a Vallex4UMR text file with its sidecar index, or the manifest of a sharded lexicon.
+    """
+    if os.path.basename(path) == MANIFEST:
+        with open(path, 'r', encoding='utf-8') as manifest:
+            shard = json.load(manifest)['shards'].get(shard_name(umr_id))
+        if shard is None:
+            return None
+        directory = os.path.dirname(path)
+        path = os.path.join(directory, shard['file'])
+        location = load_index(os.path.join(directory, shard['index']))['id'].get(umr_id)
+    else:
+        location = load_index(path + INDEX_SUFFIX)['id'].get(umr_id)
+    return read_block(path, *location) if location is not None else None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("vallex", help="Vallex4UMR text file, or manifest of a sharded lexicon (with --get).")
+    parser.add_argument("--shard_dir", help="Split the text file into shards by lemma initial in this directory.")
+    parser.add_argument("--get", help="Print the block of the entry with this UMR id.")
+    args = parser.parse_args()
+
+    if args.get is not None:
+        print(lookup(args.vallex, args.get) or '', end='')
+    elif args.shard_dir:
+        print(write_shards(args.vallex, args.shard_dir))
+    else:
+        print(write_index(args.vallex))